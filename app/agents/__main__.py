@@ -0,0 +1,62 @@
+"""
+Run pipeline stage workers without the API server, e.g.
+
+    python -m app.agents --stage extractor --consumers 8
+    python -m app.agents --stage classifier --stage router
+
+Stages consume from durable shared queues, so any number of these processes can run
+on any number of nodes alongside (or instead of) the workers started by the API. Every
+worker must see the same state as the API: the database, the `uploads/` directory
+(relative to the working directory) and `text_store.path`. Document updates a worker
+broadcasts reach only WebSocket clients connected to its own process; clients of the
+API see them through the change feed, which reads the database.
+"""
+import argparse
+import threading
+from app.utils.config import settings
+from app.utils.logging import setup_logging
+from app.agents.ingestor import start_ingestor
+from app.agents.extractor import start_extractor
+from app.agents.classifier import start_classifier
+from app.agents.router import start_router
+
+logger = setup_logging()
+
+STARTERS = {
+    "ingestor": start_ingestor,
+    "extractor": start_extractor,
+    "classifier": start_classifier,
+    "router": start_router,
+}
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.agents", description="Run document pipeline workers")
+    parser.add_argument("--stage", action="append", choices=[*STARTERS, "all"], required=True,
+                        help="Stage to run; repeat for several stages")
+    parser.add_argument("--consumers", type=int, help="Override the configured number of documents each stage processes concurrently")
+    parser.add_argument("--same-host", action="store_true",
+                        help="Allow a SQLite database, shared with an API on this host")
+    args = parser.parse_args()
+
+    if settings.message_bus_backend == "memory":
+        parser.error("message_bus.backend is memory; its queues exist only inside the API process")
+    if settings.database_url.startswith("sqlite") and not args.same_host:
+        parser.error(
+            f"database.url is SQLite ({settings.database_url}), which workers on other hosts cannot share; "
+            "use a database server, or pass --same-host for workers next to the API"
+        )
+
+    stages = list(STARTERS) if "all" in args.stage else list(dict.fromkeys(args.stage))
+    for stage in stages:
+        if args.consumers:
+            setattr(settings, f"{stage}_consumers", args.consumers)
+        STARTERS[stage]()
+    logger.info(f"Running workers for {', '.join(stages)}")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        logger.info("Stopping workers")
+
+if __name__ == "__main__":
+    main()
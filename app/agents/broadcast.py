@@ -1,4 +1,5 @@
 from typing import Dict, Optional
+from app.services.change_log import notify_changes
 from app.utils.websocket import broadcast_document_update, broadcast_mailbox_update
 
 async def notify_document_update(document: Dict):
@@ -15,6 +16,8 @@ async def notify_document_update(document: Dict):
     #     "last_updated": updated_at,
     # }
     await broadcast_document_update(document)
+    # Wake change feed long-polls waiting in this process
+    notify_changes()
 
 async def notify_mailbox_update(config_id: str, status: str, message: str, doc_id: Optional[str] = None):
     """
@@ -1,74 +1,249 @@
 import asyncio
-import pika
-import json
+import fcntl
+import os
+import time
 from threading import Thread
+from typing import Dict, List, Optional, Set, Tuple
 from app.agents.broadcast import notify_document_update
-from app.message_bus.bus import MessageBus
+from app.agents.runtime import StageConsumer, publish, run_blocking, run_llm
+from app.utils.config import settings
 from app.message_bus.events import DocTextEvent, DocTypeEvent
-from app.utils.helpers import sqlalchemy_obj_to_dict
 from app.utils.logging import setup_logging
-from app.database.db import get_db
+from app.database.db import session_scope
+from app.services.status_writer import write_status
 from app.models.document import Document
-from sqlalchemy.orm import Session
-from app.services.llm import classify_document
+from sqlalchemy import and_, func, or_, select
+from app.services.llm import classify_document, classify_documents_batch, parse_json_response
+from app.services.cache import classification_cache
+from app.services.tokens import count_tokens
+from app.services.classifier import classify_document as classify_document_locally, local_classifier
+from app.services import text_store
 
 logger = setup_logging()
 
-def classifier_worker():
-    message_bus = MessageBus()
-    channel, queue_name = message_bus.subscribe("doc.text")
-    
-    def callback(ch, method, properties, body):
+def cached_classification(event: DocTextEvent) -> Optional[Dict]:
+    # The extractor already classified the document in combined mode
+    if event.classification:
+        return event.classification
+
+    res = classification_cache.get(event.cache_key)
+    if res:
+        logger.info(f"Reused cached classification for document {event.doc_id}")
+    return res
+
+def classify_text(event: DocTextEvent, text: Optional[str] = None) -> Dict:
+    started = time.perf_counter()
+    res = classify_document(event.load_text() if text is None else text, str(event.entities))
+    res = parse_json_response(res)
+    classification_cache.set(event.cache_key, res, cost_seconds=time.perf_counter() - started)
+    return res
+
+def classify_batch(batch: List[Tuple[DocTextEvent, str]]) -> List[Dict]:
+    """
+    Classify (event, text) pairs with one LLM call. Documents missing from the reply,
+    or every document when the reply cannot be parsed, are classified one by one.
+    """
+    if len(batch) == 1:
+        return [classify_text(*batch[0])]
+
+    started = time.perf_counter()
+    reply = classify_documents_batch([(event.doc_id, text, str(event.entities)) for event, text in batch])
+    try:
+        results = parse_json_response(reply)["results"]
+        by_id = {str(result["doc_id"]): result for result in results}
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Could not parse batched classification of {len(batch)} documents: {e}")
+        by_id = {}
+    cost = (time.perf_counter() - started) / len(batch)
+
+    classifications = []
+    for event, text in batch:
+        result = by_id.get(event.doc_id, {})
+        if "category" in result and "confidence_score" in result:
+            res = {"category": result["category"], "confidence_score": result["confidence_score"]}
+            classification_cache.set(event.cache_key, res, cost_seconds=cost)
+        else:
+            logger.warning(f"No batched classification for document {event.doc_id}, classifying it alone")
+            res = classify_text(event, text)
+        classifications.append(res)
+    return classifications
+
+class ClassificationBatcher:
+    """
+    Collects short documents on the pipeline loop and classifies them together. A batch
+    is sent when it holds `max_docs` documents, when adding a document would exceed
+    `max_tokens`, or `window_seconds` after its first document arrived.
+    """
+
+    def __init__(self, max_docs: int, window_seconds: float, max_tokens: int):
+        self.max_docs = max_docs
+        self.window_seconds = window_seconds
+        self.max_tokens = max_tokens
+        self._pending: List[Tuple[DocTextEvent, str, asyncio.Future]] = []
+        self._tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Running batches, referenced so they are not garbage collected mid-call
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def classify(self, event: DocTextEvent, text: str) -> Dict:
+        loop = asyncio.get_running_loop()
+        tokens = count_tokens(text)
+        if self._pending and self._tokens + tokens > self.max_tokens:
+            self._flush()
+        future = loop.create_future()
+        self._pending.append((event, text, future))
+        self._tokens += tokens
+        if len(self._pending) >= self.max_docs:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._tokens = self._pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[DocTextEvent, str, asyncio.Future]]):
+        # Handlers cancelled while waiting for the batch no longer need an answer
+        batch = [entry for entry in batch if not entry[2].done()]
+        if not batch:
+            return
         try:
-            event = DocTextEvent.parse_raw(body)
-            
-            # Classify document
-            res = classify_document(event.text, str(event.entities))
-            res = json.loads(res.strip().removeprefix("```json").removesuffix("```").strip())
-
-            print(res)
-            doc_type = res["category"]
-            confidence = int(res["confidence_score"])
-
-            # Update document in database
-            db = next(get_db())
-            document = db.query(Document).filter(Document.id == event.doc_id).first()
-            if document:
-                document.type = doc_type
-                document.confidence = confidence
-                document.status = "classified"
-                db.commit()
-                db.refresh(document)
-                asyncio.run(notify_document_update(sqlalchemy_obj_to_dict(document)))
-
-            
-            # Publish doc.type event
-            type_event = DocTypeEvent(
-                doc_id=event.doc_id,
-                type=doc_type,
-                score=confidence
+            results = await run_llm(classify_batch, [(event, text) for event, text, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+batcher = ClassificationBatcher(
+    max_docs=settings.classifier_batch_size,
+    window_seconds=settings.classifier_batch_window_ms / 1000,
+    max_tokens=settings.classifier_batch_max_tokens
+)
+
+def classify_locally(text: str) -> Optional[Dict]:
+    """The rules/local model answer when it is confident enough, else None (escalate to the LLM)."""
+    if not settings.local_classifier_enabled:
+        return None
+    doc_type, confidence, source = classify_document_locally(text)
+    if source and confidence >= settings.local_classifier_threshold:
+        local_classifier.record(source)
+        return {"category": doc_type, "confidence_score": round(confidence * 100), "source": source}
+    local_classifier.record(None)
+    return None
+
+def train_local_classifier() -> bool:
+    """
+    Retrain the local model on the newest `local_classifier_max_samples_per_type`
+    documents of each type typed by an override or by an LLM classification of at
+    least `local_classifier_confirm_confidence`.
+    Types assigned by the local classifier itself are never used as labels.
+    """
+    confirmed = select(
+        Document.type, Document.text_ref,
+        func.row_number().over(partition_by=Document.type, order_by=Document.updated_at.desc()).label("rank")
+    ).where(
+        Document.type.isnot(None),
+        Document.text_ref.isnot(None),
+        or_(
+            Document.type_source == "override",
+            and_(
+                or_(Document.type_source == "llm", Document.type_source.is_(None)),
+                Document.confidence >= settings.local_classifier_confirm_confidence
             )
-            message_bus.publish("doc.type", type_event.json())
-            logger.warning(type_event.json())
-            logger.info(f"Classified document {event.doc_id} as {doc_type} with confidence {confidence}")
-            
-            # Acknowledge message
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid event data: {e}")
+        )
+    ).subquery()
+    with session_scope() as db:
+        rows = db.execute(
+            select(confirmed.c.type, confirmed.c.text_ref)
+            .where(confirmed.c.rank <= settings.local_classifier_max_samples_per_type)
+        ).all()
+    texts, labels = [], []
+    for doc_type, text_ref in rows:
+        if text_store.has_text(text_ref):
+            texts.append(text_store.get_text(text_ref))
+            labels.append(doc_type.strip().lower())
+    return local_classifier.train(texts, labels)
+
+def _training_lock() -> bool:
+    """
+    Take the lock that makes one process on this host the trainer; the others load the
+    model it saves. Held until the process exits, so another takes over if it dies.
+    """
+    path = f"{settings.local_classifier_model_path}.lock"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        os.close(fd)
+        return False
+
+def _retrain_forever():
+    while not _training_lock():
+        time.sleep(settings.local_classifier_retrain_seconds)
+    logger.info("This process trains the local classifier")
+    while True:
+        try:
+            if not train_local_classifier():
+                logger.info("Not enough confirmed documents to train the local classifier yet")
         except Exception as e:
-            logger.error(f"Error processing document {event.doc_id}: {e}")
+            logger.error(f"Failed to train local classifier: {e}")
+        time.sleep(settings.local_classifier_retrain_seconds)
+
+async def classify_event(event: DocTextEvent) -> Dict:
+    res = await run_blocking(cached_classification, event)
+    if res:
+        return res
+    text = await run_blocking(event.load_text)
+    res = await run_blocking(classify_locally, text)
+    if res:
+        return res
+    if batcher.max_docs > 1 and count_tokens(text) <= settings.classifier_batch_doc_tokens:
+        return await batcher.classify(event, text)
+    return await run_llm(classify_text, event, text)
+
+async def handle_doc_text(body: bytes):
+    event = DocTextEvent.parse_raw(body)
     
-    try:
-        channel.basic_consume(queue=queue_name, on_message_callback=callback)
-        logger.info("Classifier worker started consuming messages")
-        channel.start_consuming()
-    except pika.exceptions.AMQPError as e:
-        logger.error(f"Error in message consumption: {e}")
-    finally:
-        message_bus.close()
+    # Classify document
+    res = await classify_event(event)
+    doc_type = res["category"]
+    confidence = int(res["confidence_score"])
+
+    # Update document in database
+    doc = await write_status(
+        event.doc_id, "classified",
+        type=doc_type, confidence=confidence, type_source=res.get("source", "llm")
+    )
+    await notify_document_update(doc)
+    
+    # Publish doc.type event
+    type_event = DocTypeEvent(
+        doc_id=event.doc_id,
+        type=doc_type,
+        score=confidence
+    )
+    await publish("doc.type", type_event.json())
+    logger.debug(type_event.json())
+    logger.info(f"Classified document {event.doc_id} as {doc_type} with confidence {confidence}")
 
 def start_classifier():
-    thread = Thread(target=classifier_worker, daemon=True)
-    thread.start()
-    logger.info("Classifier worker started")
\ No newline at end of file
+    if settings.local_classifier_enabled:
+        Thread(target=_retrain_forever, name="local-classifier-training", daemon=True).start()
+    StageConsumer(
+        "classifier", "doc.text", handle_doc_text,
+        concurrency=settings.classifier_consumers,
+        prefetch=settings.classifier_prefetch
+    ).start()
\ No newline at end of file
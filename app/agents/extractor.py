@@ -1,75 +1,97 @@
-import asyncio
-import pika
-import json
-from threading import Thread
+import hashlib
+import time
+from typing import Dict, Optional, Tuple
 from app.agents.broadcast import notify_document_update
-from app.message_bus.bus import MessageBus
+from app.agents.runtime import StageConsumer, publish, run_llm
+from app.utils.config import settings
 from app.message_bus.events import DocReceivedEvent, DocTextEvent
-from app.utils.helpers import sqlalchemy_obj_to_dict
 from app.utils.logging import setup_logging
-from app.services.ocr import extract_text
 # from app.services.nlp import clean_text, extract_entities
-from app.database.db import get_db
-from app.models.document import Document
-from sqlalchemy.orm import Session
-from app.services.llm import process_file, extract_entities
+from app.services.status_writer import write_status
+from app.services.llm import process_file, extract_document_entities, analyze_document
+from app.services.tokens import count_tokens
+from app.services.cache import extraction_cache, classification_cache
+from app.services import text_store
 
 logger = setup_logging()
 
-def extractor_worker():
-    message_bus = MessageBus()
-    channel, queue_name = message_bus.subscribe("doc.received")
+def result_cache_key(content_hash: str, email_body: str) -> str:
+    """
+    Entities are extracted from the email body and the file text together, so the
+    email body is part of the key when present.
+    """
+    if not content_hash or not email_body:
+        return content_hash
+    return f"{content_hash}:{hashlib.sha256(email_body.encode('utf-8')).hexdigest()[:16]}"
+
+def extract_document(event: DocReceivedEvent, cache_key: str) -> Tuple[str, Optional[str], Dict, Optional[Dict]]:
+    """
+    Returns the text store reference of the extracted text, the text itself when it is
+    small enough to send inline, the entities, and in combined mode the classification.
+    """
+    # Events published before uploads were stored under their doc_id carry no file_path
+    file_path = event.metadata.get("file_path") or f"uploads/{event.file_name}"
+    email_body = event.metadata.get("email_body", "")
+
+    cached = extraction_cache.get(cache_key)
+    if cached and text_store.has_text(cached.get("text_ref")):
+        logger.info(f"Reused cached extraction for document {event.doc_id}")
+        return cached["text_ref"], text_store.inline_text(cached["text_ref"]), cached["entities"], None
+
+    started = time.perf_counter()
+    cleaned_text = process_file(file_path)
     
-    def callback(ch, method, properties, body):
-        try:
-            event = DocReceivedEvent.parse_raw(body)
-            file_path = f"uploads/{event.file_name}"
+    # Extract entities
+    content = email_body + "\n" + cleaned_text
+    classification = None
+    # Documents too long for one call are extracted in chunks and classified separately
+    if settings.llm_combined_mode and count_tokens(content) <= settings.llm_chunk_tokens:
+        result = analyze_document(content)
+        entities = result.pop("entities", None) or {}
+        if "category" in result and "confidence_score" in result:
+            classification = result
+    else:
+        entities = extract_document_entities(content)
+    text_ref = text_store.put_text(cleaned_text)
+    extraction_cache.set(
+        cache_key,
+        {"text_ref": text_ref, "entities": entities},
+        cost_seconds=time.perf_counter() - started
+    )
+    if classification:
+        # The call's cost is already accounted to the extraction entry
+        classification_cache.set(cache_key, classification, cost_seconds=0.0)
+    inline = cleaned_text if len(cleaned_text.encode("utf-8")) <= settings.text_store_inline_bytes else None
+    return text_ref, inline, entities, classification
 
-            cleaned_text = process_file(file_path)
-            
-            # Extract entities
-            entities = extract_entities(event.metadata.get("email_body", "") + "\n" + cleaned_text)
-            entities = entities.strip().removeprefix("```json").removesuffix("```").strip()
-            entities = json.loads(entities)
+async def handle_doc_received(body: bytes):
+    event = DocReceivedEvent.parse_raw(body)
+    cache_key = result_cache_key(event.metadata.get("content_hash"), event.metadata.get("email_body", ""))
+    text_ref, text, entities, classification = await run_llm(extract_document, event, cache_key)
 
-            # Update document status in database
-            db = next(get_db())
-            document = db.query(Document).filter(Document.id == event.doc_id).first()
-            if document:
-                document.status = "extracted"
-                db.commit()
-                db.refresh(document)
-                doc = sqlalchemy_obj_to_dict(document)
-                asyncio.run(notify_document_update(doc))
-            
-            # Publish doc.text event
-            text_event = DocTextEvent(
-                doc_id=event.doc_id,
-                text=cleaned_text,
-                entities=entities if not entities == None else {} 
-            )
-            message_bus.publish("doc.text", text_event.json())
-            logger.warning(text_event.json())
-            
-            logger.info(f"Extracted text and entities for document {event.doc_id} ({event.file_name})")
-            
-            # Acknowledge message
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid event data: {e}")
-        except Exception as e:
-            logger.error(f"Error processing document {event.doc_id}: {e}")
+    # Update document status in database
+    doc = await write_status(event.doc_id, "extracted", text_ref=text_ref)
+    await notify_document_update(doc)
+    
+    # Publish doc.text event
+    text_event = DocTextEvent(
+        doc_id=event.doc_id,
+        text=text,
+        text_ref=text_ref,
+        entities=entities if not entities == None else {},
+        cache_key=cache_key,
+        classification=classification
+    )
+    await publish("doc.text", text_event.json(exclude_none=True))
     
-    try:
-        channel.basic_consume(queue=queue_name, on_message_callback=callback)
-        logger.info("Extractor worker started consuming messages")
-        channel.start_consuming()
-    except pika.exceptions.AMQPError as e:
-        logger.error(f"Error in message consumption: {e}")
-    finally:
-        message_bus.close()
+    logger.info(
+        f"Extracted text and entities for document {event.doc_id} ({event.file_name}), "
+        f"text {'inline' if text is not None else 'by reference'} {text_ref}"
+    )
 
 def start_extractor():
-    thread = Thread(target=extractor_worker, daemon=True)
-    thread.start()
-    logger.info("Extractor worker started")
\ No newline at end of file
+    StageConsumer(
+        "extractor", "doc.received", handle_doc_received,
+        concurrency=settings.extractor_consumers,
+        prefetch=settings.extractor_prefetch
+    ).start()
\ No newline at end of file
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from threading import BoundedSemaphore, Lock, Thread
+from typing import Awaitable, Callable, Optional
+import pika
+from app.message_bus.bus import MessageBus, publisher_pool, stage_queue
+from app.utils.config import settings
+from app.utils.logging import setup_logging
+
+logger = setup_logging()
+
+# Blocking work (file reads, DB sessions, publishing) runs here, so the number of
+# threads is fixed no matter how many documents are in flight
+_executor = ThreadPoolExecutor(max_workers=settings.pipeline_executor_workers, thread_name_prefix="pipeline")
+# LLM calls get their own threads: while the rate limiter holds them back they would
+# otherwise occupy every thread and stall the stages' status writes
+_llm_executor = ThreadPoolExecutor(max_workers=settings.llm_executor_workers, thread_name_prefix="pipeline-llm")
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = Lock()
+
+def bind_loop(loop: asyncio.AbstractEventLoop):
+    """
+    Run stage handlers on `loop`. The API binds its own loop at startup so WebSocket
+    broadcasts from the pipeline are sent from the loop that owns the connections.
+    """
+    global _loop
+    with _loop_lock:
+        _loop = loop
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """The bound loop, or a private loop on a background thread (standalone workers)."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            Thread(target=_loop.run_forever, name="pipeline-loop", daemon=True).start()
+        return _loop
+
+def run_coroutine(coro: Awaitable) -> Future:
+    """Schedule `coro` on the pipeline loop from any thread."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+async def run_blocking(func: Callable, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(_executor, partial(func, *args, **kwargs))
+
+async def run_llm(func: Callable, *args, **kwargs):
+    """Like `run_blocking`, for functions that call the LLM."""
+    return await asyncio.get_running_loop().run_in_executor(_llm_executor, partial(func, *args, **kwargs))
+
+async def publish(routing_key: str, message: str):
+    if settings.message_bus_backend == "memory":
+        # A full queue must not fail the message: the status is already written and
+        # nothing would redeliver it
+        await publisher_pool.publish_async(routing_key, message)
+        return
+    await run_blocking(publisher_pool.publish, routing_key, message)
+
+class StageConsumer:
+    """
+    Feeds one stage's queue into coroutine handlers on the pipeline loop.
+    A single connection thread receives deliveries; up to `concurrency` handlers run at
+    once, and each delivery is acked (or rejected if the handler raised) from the
+    connection thread when its coroutine finishes.
+    """
+
+    def __init__(self, stage: str, routing_key: str, handler: Callable[[bytes], Awaitable], concurrency: int, prefetch: int):
+        self.stage = stage
+        self.routing_key = routing_key
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        # The broker must hand out at least as many messages as we process at once
+        self.prefetch = max(prefetch, self.concurrency)
+        self._slots = asyncio.Semaphore(self.concurrency)
+
+    def start(self):
+        target = self._consume_memory if settings.message_bus_backend == "memory" else self._consume_forever
+        Thread(target=target, name=f"{self.stage}-consumer", daemon=True).start()
+        logger.info(f"{self.stage.capitalize()} worker started with concurrency {self.concurrency}")
+
+    async def _run(self, body: bytes):
+        async with self._slots:
+            await self.handler(body)
+
+    def _consume_forever(self):
+        while True:
+            try:
+                self._consume()
+            except pika.exceptions.AMQPError as e:
+                logger.error(f"Error in {self.stage} message consumption: {e}")
+            except Exception:
+                # e.g. DNS or socket errors while connecting; the stage must keep retrying
+                logger.exception(f"Unexpected error in {self.stage} message consumption")
+            time.sleep(5)
+            logger.info(f"Reconnecting {self.stage} consumer")
+
+    def _consume(self):
+        message_bus = MessageBus()
+        try:
+            channel, queue_name = message_bus.subscribe(
+                self.routing_key,
+                queue_name=stage_queue(self.stage),
+                prefetch_count=self.prefetch
+            )
+
+            def on_message(ch, method, properties, body):
+                future = run_coroutine(self._run(body))
+                future.add_done_callback(partial(self._on_done, message_bus, ch, method.delivery_tag))
+
+            channel.basic_consume(queue=queue_name, on_message_callback=on_message)
+            logger.info(f"{self.stage.capitalize()} worker started consuming messages")
+            channel.start_consuming()
+        finally:
+            try:
+                message_bus.close()
+            except Exception:
+                pass
+
+    def _consume_memory(self):
+        from app.message_bus.memory import memory_broker
+        source = memory_broker.declare_queue(stage_queue(self.stage), self.routing_key)
+        # Mirrors basic_qos: take a message only while fewer than `prefetch` are in flight
+        in_flight = BoundedSemaphore(self.prefetch)
+        logger.info(f"{self.stage.capitalize()} worker started consuming in-memory messages")
+        while True:
+            in_flight.acquire()
+            body = source.get()
+            future = run_coroutine(self._run(body))
+            future.add_done_callback(partial(self._on_memory_done, in_flight))
+
+    def _on_memory_done(self, in_flight: BoundedSemaphore, future: Future):
+        in_flight.release()
+        if future.exception():
+            logger.error(f"Error processing {self.stage} message: {future.exception()}")
+
+    def _on_done(self, message_bus: MessageBus, channel, delivery_tag: int, future: Future):
+        error = future.exception()
+        if error:
+            logger.error(f"Error processing {self.stage} message: {error}")
+
+        def settle():
+            if error:
+                channel.basic_nack(delivery_tag=delivery_tag, requeue=False)
+            else:
+                channel.basic_ack(delivery_tag=delivery_tag)
+
+        try:
+            # pika channels may only be used from their connection's thread
+            message_bus.connection.add_callback_threadsafe(settle)
+        except pika.exceptions.AMQPError as e:
+            # The broker redelivers unacknowledged messages once the connection is gone
+            logger.warning(f"Could not settle {self.stage} message {delivery_tag}: {e}")
@@ -1,121 +1,217 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
-from app.database.db import get_db
+from app.agents.broadcast import notify_document_update
+from app.database.db import run_db
 from app.models.document import Document
-from app.message_bus.bus import MessageBus
+from app.message_bus.bus import publisher_pool
 from app.message_bus.events import DocTypeEvent, DocRoutedEvent
+from app.services.change_log import read_changes, record_changes, wait_for_changes
+from app.utils.config import settings
 from app.utils.logging import setup_logging
 from app.api.v1.schemas import DocumentResponse, DocumentStatusResponse, DocumentOverrideRequest
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 logger = setup_logging()
 
+def load_document_status(db: Session, doc_id: str) -> Optional[DocumentStatusResponse]:
+    document = db.query(Document).filter(Document.id == doc_id).first()
+    if not document:
+        return None
+    return DocumentStatusResponse(
+        doc_id=document.id,
+        filename=document.name,
+        status=document.status,
+        type=document.type,
+        confidence=document.confidence,
+        destination=document.destination
+    )
+
+@router.get("/changes")
+async def get_document_changes(
+    since: int = Query(0, ge=0),
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    wait: float = Query(0, ge=0, le=settings.change_feed_max_wait)
+):
+    """
+    Change feed: documents changed after sequence number `since`, each with its latest
+    state only, oldest first. Pass the returned `seq` as `since` next time. With `wait`,
+    long-polls for up to that many seconds while there are no changes. `reset` means
+    the changes after `since` are no longer kept: reload `GET /documents` instead.
+    """
+    try:
+        deadline = time.monotonic() + wait
+        while True:
+            changes, seq, reset, more = await run_db(read_changes, since, status, type, limit)
+            remaining = deadline - time.monotonic()
+            if changes or reset or remaining <= 0:
+                break
+            # Woken by changes made in this process; changes made elsewhere are polled for
+            await wait_for_changes(min(remaining, settings.change_feed_poll_interval))
+            since = seq
+        return {"changes": changes, "seq": seq, "reset": reset, "more": more}
+    except Exception as e:
+        logger.error(f"Failed to read document changes since {since}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to read document changes")
+
 @router.get("/{doc_id}", response_model=DocumentStatusResponse)
-async def get_document_status(doc_id: str, db: Session = Depends(get_db)):
+async def get_document_status(doc_id: str):
     try:
-        document = db.query(Document).filter(Document.id == doc_id).first()
+        document = await run_db(load_document_status, doc_id)
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
         
         logger.info(f"Retrieved status for document {doc_id}")
-        return DocumentStatusResponse(
-            doc_id=document.id,
-            filename=document.name,
-            status=document.status,
-            type=document.type,
-            confidence=document.confidence,
-            destination=document.destination
-        )
+        return document
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to retrieve status for document {doc_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve document status")
     
+def encode_cursor(document: Document) -> str:
+    position = f"{document.updated_at.isoformat()}|{document.id}"
+    return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        updated_at, doc_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(updated_at), doc_id
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def list_documents(db: Session, status: Optional[str], type: Optional[str], destination: Optional[str],
+                   limit: int, position: Optional[Tuple[datetime, str]]) -> Tuple[List[DocumentResponse], Optional[str]]:
+    query = db.query(Document)
+    if status is not None:
+        query = query.filter(Document.status == status)
+    if type is not None:
+        query = query.filter(Document.type == type)
+    if destination is not None:
+        query = query.filter(Document.destination == destination)
+    if position:
+        # Keyset pagination: continue strictly after the last row of the previous page
+        updated_at, doc_id = position
+        query = query.filter(or_(
+            Document.updated_at < updated_at,
+            and_(Document.updated_at == updated_at, Document.id < doc_id)
+        ))
+    documents = query.order_by(Document.updated_at.desc(), Document.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1])
+    page = [
+        DocumentResponse(
+            id=doc.id,
+            name=doc.name,
+            status=doc.status,
+            type=doc.type,
+            confidence=doc.confidence,
+            destination=doc.destination,
+            created_at=doc.created_at,
+            updated_at=doc.updated_at
+        )
+        for doc in documents
+    ]
+    return page, next_cursor
+
 @router.get("", response_model=List[DocumentResponse])
-async def get_all_documents(db: Session = Depends(get_db)):
+async def get_all_documents(
+    response: Response,
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    destination: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
+):
+    """
+    Most recently updated documents first. When more documents match, the
+    `X-Next-Cursor` response header holds the `cursor` for the next page.
+    """
     try:
-        documents = db.query(Document).all()
-        if not documents:
-            return []
+        position = decode_cursor(cursor) if cursor else None
+        documents, next_cursor = await run_db(list_documents, status, type, destination, limit, position)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         
-        logger.info("Retrieved all documents from database")
-        response = [
-            DocumentResponse(
-                id=doc.id,
-                name=doc.name,
-                status=doc.status,
-                type=doc.type,
-                confidence=doc.confidence,
-                destination=doc.destination,
-                created_at=doc.created_at,
-                updated_at=doc.updated_at
-            )
-            for doc_id, doc in enumerate(documents)
-        ]
-        response.sort(key=lambda doc: doc.updated_at, reverse=True)
-        return response
+        logger.info(f"Retrieved {len(documents)} documents from database")
+        return documents
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to retrieve all documents: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve documents")
 
+def apply_override(db: Session, doc_id: str, override: DocumentOverrideRequest) -> Optional[Tuple[str, Optional[float], Dict]]:
+    """
+    Store the override and return the document's resulting (type, confidence, change),
+    or None if it does not exist.
+    """
+    document = db.query(Document).filter(Document.id == doc_id).first()
+    if not document:
+        return None
+    
+    # Update type and confidence if provided
+    if override.type is not None or override.confidence is not None:
+        if override.type is not None:
+            document.type = override.type
+            # Overridden types are training labels for the local classifier
+            document.type_source = "override"
+        if override.confidence is not None:
+            document.confidence = override.confidence
+        document.status = "classified"
+    
+    # Update destination if provided
+    if override.destination is not None:
+        document.destination = override.destination
+        document.status = "routed"
+    
+    db.flush()
+    change = record_changes(db, [doc_id])[doc_id]
+    db.commit()
+    return document.type, document.confidence, change
+
 @router.put("/{doc_id}/override")
-async def override_document(
-    doc_id: str,
-    override: DocumentOverrideRequest,
-    db: Session = Depends(get_db)
-):
+async def override_document(doc_id: str, override: DocumentOverrideRequest):
     try:
-        document = db.query(Document).filter(Document.id == doc_id).first()
-        if not document:
-            raise HTTPException(status_code=404, detail="Document not found")
-        
         # Check if at least one field is provided
         if override.type is None and override.confidence is None and override.destination is None:
             raise HTTPException(status_code=400, detail="At least one field (type, confidence, destination) must be provided")
         
-        message_bus = MessageBus()
-        updated = False
+        result = await run_db(apply_override, doc_id, override)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+        doc_type, confidence, change = result
+        await notify_document_update(change)
         
-        # Update type and confidence if provided
-        if override.type is not None or override.confidence is not None:
-            if override.type is not None:
-                document.type = override.type
-            if override.confidence is not None:
-                document.confidence = override.confidence
-            document.status = "classified"
-            updated = True
-            
-            # Publish DocTypeEvent if type or confidence changed
-            if override.type is not None:
-                type_event = DocTypeEvent(
-                    doc_id=doc_id,
-                    type=document.type,
-                    score=override.confidence or document.confidence or 1.0
-                )
-                message_bus.publish("doc.type", type_event.json())
-                logger.info(f"Overridden type for document {doc_id} to {document.type}")
+        # Publish DocTypeEvent if type changed
+        if override.type is not None:
+            type_event = DocTypeEvent(
+                doc_id=doc_id,
+                type=doc_type,
+                score=override.confidence or confidence or 1.0
+            )
+            await run_in_threadpool(publisher_pool.publish, "doc.type", type_event.json())
+            logger.info(f"Overridden type for document {doc_id} to {doc_type}")
         
-        # Update destination if provided
+        # Publish DocRoutedEvent if destination changed
         if override.destination is not None:
-            document.destination = override.destination
-            document.status = "routed"
-            updated = True
-            
-            # Publish DocRoutedEvent
             routed_event = DocRoutedEvent(
                 doc_id=doc_id,
                 destination=override.destination,
                 status="routed"
             )
-            message_bus.publish("doc.routed", routed_event.json())
+            await run_in_threadpool(publisher_pool.publish, "doc.routed", routed_event.json())
             logger.info(f"Overridden destination for document {doc_id} to {override.destination}")
         
-        # Commit changes if any updates were made
-        if updated:
-            db.commit()
-            db.refresh(document)
-        
-        message_bus.close()
         return {"message": "Document overridden successfully"}
     except HTTPException:
         raise
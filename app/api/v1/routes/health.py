@@ -1,7 +1,45 @@
 from fastapi import APIRouter
+from app.message_bus.bus import publisher_pool
+from app.services.cache import extraction_cache, classification_cache, vision_cache, prompt_cache
+from app.services.classifier import local_classifier
+from app.services.rate_limit import llm_limiter
+from app.services.status_writer import status_writer
+from app.utils.websocket import document_broadcaster, mailbox_broadcaster
 
 router = APIRouter(prefix="/health", tags=["health"])
 
 @router.get("")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@router.get("/cache")
+async def cache_stats():
+    return {
+        "extraction": extraction_cache.stats(),
+        "classification": classification_cache.stats(),
+        "vision": vision_cache.stats(),
+        "prompts": prompt_cache.stats()
+    }
+
+@router.get("/publishers")
+async def publisher_pool_stats():
+    return publisher_pool.stats()
+
+@router.get("/classifier")
+async def local_classifier_stats():
+    return local_classifier.stats()
+
+@router.get("/llm")
+async def llm_limiter_stats():
+    return llm_limiter.stats()
+
+@router.get("/status-writer")
+async def status_writer_stats():
+    return status_writer.stats()
+
+@router.get("/websockets")
+async def websocket_stats():
+    return {
+        "documents": document_broadcaster.stats(),
+        "mailbox": mailbox_broadcaster.stats()
+    }
\ No newline at end of file
@@ -1,100 +1,267 @@
-import asyncio
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
+from typing import Dict, List
 from uuid import uuid4
-import os
 
 from app.agents.broadcast import notify_document_update
-from app.database.db import get_db
+from app.database.db import run_db
 from app.models.document import Document
-from app.message_bus.bus import MessageBus
+from app.services.change_log import record_changes
+from app.message_bus.bus import publisher_pool
 from app.message_bus.events import DocReceivedEvent
 from app.utils.logging import setup_logging
-from app.utils.helpers import save_email_attachment, save_uploaded_file, sqlalchemy_obj_to_dict
-from app.api.v1.schemas import UploadResponse, EmailWebhookPayload
+from app.utils.helpers import FileTooLargeError, remove_file, save_email_attachment, save_uploaded_file
+from app.utils.email_stream import MultipartEmailParser, discard_attachments
+from app.api.v1.schemas import EmailWebhookPayload
 
 
 router = APIRouter(prefix="/ingest", tags=["ingestion"])
 logger = setup_logging()
 
+def upload_received_event(doc_id: str, filename: str, file_path: str, file_size: int, content_hash: str) -> DocReceivedEvent:
+    return DocReceivedEvent(
+        doc_id=doc_id,
+        file_name=filename,
+        metadata={
+                "input_type": "file_upload",       # (file_upload, file_share, email_hook)
+                "file_path": file_path,
+                "file_size": str(file_size),
+                "folder": "",                    # If from a file share
+                "sender": "unknown@example.com",   # If from an email
+                "email_body": "",                #If from an email
+                "content_hash": content_hash
+            },
+        priority=None
+    )
+
+def create_document(db: Session, doc_id: str, filename: str, content_hash: str) -> Dict:
+    document = Document(
+        id=doc_id,
+        name=filename,
+        status="ingested",
+        content_hash=content_hash
+    )
+    db.add(document)
+    db.flush()
+    change = record_changes(db, [document.id])[document.id]
+    db.commit()
+    return change
+
+def insert_documents(db: Session, rows: List[Dict]) -> List[Dict]:
+    db.execute(insert(Document), rows)
+    changes = record_changes(db, [row["id"] for row in rows])
+    db.commit()
+    return list(changes.values())
+
+def fail_documents(db: Session, doc_ids: List[str]) -> List[Dict]:
+    db.execute(update(Document).where(Document.id.in_(doc_ids)).values(status="failed"))
+    changes = record_changes(db, doc_ids)
+    db.commit()
+    return list(changes.values())
+
+async def abandon_documents(doc_ids: List[str]):
+    """
+    Mark documents whose event could not be published as failed, so they are not left at
+    "ingested" with nothing to process them.
+    """
+    try:
+        changes = await run_db(fail_documents, doc_ids)
+    except Exception as e:
+        logger.error(f"Failed to mark {len(doc_ids)} unpublished documents as failed: {e}")
+        return
+    for change in changes:
+        await notify_document_update(change)
+
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_file(file: UploadFile = File(...)):
+    doc_id = str(uuid4())
+    file_path = None
+    document = None
     try:
-        # Save file to uploads directory
-        file_path = save_uploaded_file(file)
+        # Stream file to uploads directory off the event loop
+        file_path, file_size, content_hash = await run_in_threadpool(save_uploaded_file, file, doc_id)
         
         # Store document metadata in database
-        document = Document(
-            id=str(uuid4()),
-            name=file.filename,
-            status="ingested"
-        )
-        db.add(document)
-        db.commit()
-        db.refresh(document)
+        document = await run_db(create_document, doc_id, file.filename, content_hash)
+        await notify_document_update(document)
         
         # Prepare and publish event
-        event = DocReceivedEvent(
-            doc_id=document.id,
-            file_name=file.filename,
-            metadata={
-                    "input_type": "file_upload",       # (file_upload, file_share, email_hook)
-                    "file_size": str(file.size),
-                    "folder": "",                    # If from a file share
-                    "sender": "unknown@example.com",   # If from an email
-                    "email_body": ""                 #If from an email
-                },
-            priority=None
-        )
-        message_bus = MessageBus()
-        message_bus.publish("doc.initialize", event.json())
-        message_bus.close()
+        event = upload_received_event(doc_id, file.filename, file_path, file_size, content_hash)
+        await run_in_threadpool(publisher_pool.publish, "doc.initialize", event.json())
         
-        logger.info(f"Uploaded document {file.filename} with ID {document.id}")
-        return {"doc_id": document.id, "filename": file.filename, "status": "ingested"}
+        logger.info(f"Uploaded document {file.filename} with ID {document['id']}")
+        return {"doc_id": document["id"], "filename": file.filename, "status": "ingested"}
+    except FileTooLargeError as e:
+        logger.error(f"Rejected upload {file.filename}: {e}")
+        raise HTTPException(status_code=413, detail="File too large")
     except Exception as e:
         logger.error(f"Failed to process upload {file.filename}: {e}")
+        if document:
+            await abandon_documents([doc_id])
+        await run_in_threadpool(remove_file, file_path)
         raise HTTPException(status_code=500, detail="Failed to process upload")
     
+@router.post("/bulk")
+async def bulk_upload_files(files: List[UploadFile] = File(...)):
+    """
+    Ingest many files in one request: all document rows are inserted in one transaction
+    and all doc.initialize events are published as one confirmed batch.
+    Files that fail to save are reported individually and do not fail the batch. If the
+    batch cannot be published its documents are marked failed and listed in a 503 error.
+    """
+    results = []
+    rows = []
+    events = []
+    file_paths = []
+    for file in files:
+        doc_id = str(uuid4())
+        try:
+            file_path, file_size, content_hash = await run_in_threadpool(save_uploaded_file, file, doc_id)
+        except FileTooLargeError:
+            results.append({"filename": file.filename, "status": "failed", "error": "File too large"})
+            continue
+        except Exception as e:
+            logger.error(f"Failed to save bulk upload {file.filename}: {e}")
+            results.append({"filename": file.filename, "status": "failed", "error": "Failed to save file"})
+            continue
+        rows.append({"id": doc_id, "name": file.filename, "status": "ingested", "content_hash": content_hash})
+        events.append(upload_received_event(doc_id, file.filename, file_path, file_size, content_hash).json())
+        results.append({"doc_id": doc_id, "filename": file.filename, "status": "ingested"})
+        file_paths.append(file_path)
+    
+    if not rows:
+        return {"ingested": 0, "failed": len(results), "documents": results}
+    
+    try:
+        changes = await run_db(insert_documents, rows)
+    except Exception as e:
+        logger.error(f"Failed to store bulk upload of {len(rows)} documents: {e}")
+        for file_path in file_paths:
+            await run_in_threadpool(remove_file, file_path)
+        raise HTTPException(status_code=500, detail="Failed to store documents")
+    for change in changes:
+        await notify_document_update(change)
+    
+    try:
+        await run_in_threadpool(publisher_pool.publish_batch, "doc.initialize", events)
+    except Exception as e:
+        logger.error(f"Failed to publish bulk upload of {len(rows)} documents: {e}")
+        await abandon_documents([row["id"] for row in rows])
+        for file_path in file_paths:
+            await run_in_threadpool(remove_file, file_path)
+        for result in results:
+            if result["status"] == "ingested":
+                result.update(status="failed", error="Failed to queue for processing")
+        raise HTTPException(status_code=503, detail={
+            "message": "Failed to publish documents; they were marked failed and can be uploaded again",
+            "documents": results
+        })
+    
+    logger.info(f"Bulk uploaded {len(rows)} documents ({len(results) - len(rows)} failed)")
+    return {"ingested": len(rows), "failed": len(results) - len(rows), "documents": results}
+
+async def ingest_email_attachment(doc_id: str, filename: str, file_path: str, file_size: int, content_hash: str,
+                                  sender: str, subject: str, email_body: str = "") -> Dict:
+    """
+    Store the document row for an attachment already saved to uploads/ and publish doc.received.
+    """
+    document = await run_db(create_document, doc_id, filename, content_hash)
+    await notify_document_update(document)
+    
+    # Prepare and publish event
+    event = DocReceivedEvent(
+        doc_id=doc_id,
+        file_name=filename,
+        metadata={
+            "file_path": file_path,
+            "file_size": str(file_size),
+            "sender": sender,
+            "subject": subject or "",
+            "source": "email",
+            "email_body": email_body,
+            "content_hash": content_hash
+        },
+        priority=None
+    )
+    try:
+        await run_in_threadpool(publisher_pool.publish, "doc.received", event.json())
+    except Exception:
+        await abandon_documents([doc_id])
+        raise
+    
+    logger.info(f"Ingested email attachment {filename} with ID {document['id']}")
+    return document
+
 @router.post("/email")
-async def process_email_webhook(payload: EmailWebhookPayload, db: Session = Depends(get_db)):
+async def process_email_webhook(payload: EmailWebhookPayload):
     try:
-        message_bus = MessageBus()
         response = {"message": "Email processed successfully", "documents": []}
         
         # Process each attachment
         for attachment in payload.attachments:
             # Save attachment to uploads directory
-            file_path, filename, file_size = save_email_attachment(attachment)
-            
-            # Store document metadata in database
-            document = Document(
-                name=filename,
-                status="ingested"
-            )
-            db.add(document)
-            db.commit()
-            db.refresh(document)
-            asyncio.run(notify_document_update(sqlalchemy_obj_to_dict(document)))
-            
-            # Prepare and publish event
-            event = DocReceivedEvent(
-                doc_id=document.id,
-                file_name=filename,
-                metadata={
-                    "file_size": str(file_size),
-                    "sender": payload.from_email,
-                    "subject": payload.subject or "",
-                    "source": "email"
-                }
-            )
-            message_bus.publish("doc.received", event.json())
-            
-            logger.info(f"Ingested email attachment {filename} with ID {document.id}")
-            response["documents"].append({"doc_id": document.id, "filename": filename})
+            doc_id = str(uuid4())
+            file_path, filename, file_size, content_hash = await run_in_threadpool(save_email_attachment, attachment, doc_id)
+            try:
+                document = await ingest_email_attachment(
+                    doc_id, filename, file_path, file_size, content_hash, payload.from_email, payload.subject
+                )
+            except Exception:
+                # Nothing will process the saved file
+                await run_in_threadpool(remove_file, file_path)
+                raise
+            response["documents"].append({"doc_id": document["id"], "filename": filename})
         
-        message_bus.close()
         return response
     except Exception as e:
         logger.error(f"Failed to process email webhook: {e}")
+        raise HTTPException(status_code=500, detail="Failed to process email webhook")
+
+@router.post("/email/multipart")
+async def process_email_multipart(request: Request):
+    """
+    Email webhook taking multipart/form-data (the format SendGrid Inbound Parse posts).
+    Sender is read from `from_email` or `from`, the body from `text` or `body`; every
+    file part is an attachment and is streamed to disk as it arrives.
+    """
+    try:
+        parser = MultipartEmailParser(request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(parser.write, chunk)
+        await run_in_threadpool(parser.finalize)
+    except FileTooLargeError as e:
+        await run_in_threadpool(parser.abort)
+        logger.error(f"Rejected email webhook: {e}")
+        raise HTTPException(status_code=413, detail="Attachment too large")
+    except Exception as e:
+        await run_in_threadpool(parser.abort)
+        logger.error(f"Failed to parse multipart email webhook: {e}")
+        raise HTTPException(status_code=400, detail="Malformed multipart email")
+    
+    try:
+        fields = parser.fields
+        sender = fields.get("from_email") or fields.get("from", "")
+        email_body = fields.get("text") or fields.get("body", "")
+        response = {"message": "Email processed successfully", "documents": []}
+        for index, attachment in enumerate(parser.attachments):
+            try:
+                document = await ingest_email_attachment(
+                    attachment.doc_id, attachment.filename, attachment.file_path, attachment.file_size,
+                    attachment.content_hash, sender, fields.get("subject"), email_body
+                )
+            except Exception:
+                # This and the remaining attachments were saved but will never be processed
+                await run_in_threadpool(discard_attachments, parser.attachments[index:])
+                raise
+            response["documents"].append({"doc_id": document["id"], "filename": attachment.filename})
+        
+        return response
+    except Exception as e:
+        logger.error(f"Failed to process multipart email webhook: {e}")
         raise HTTPException(status_code=500, detail="Failed to process email webhook")
\ No newline at end of file
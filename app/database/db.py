@@ -1,20 +1,102 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+from sqlalchemy import create_engine, event, inspect, make_url, text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
 from app.utils.config import settings
 from app.models.document import Base
 
+is_sqlite = settings.database_url.startswith("sqlite")
+is_memory = is_sqlite and make_url(settings.database_url).database in (None, "", ":memory:")
+
+if is_memory:
+    # Every connection to ":memory:" is a new, empty database, so all threads share one.
+    # Statements from concurrent threads are not serialized: meant for tests and trials
+    pool_args = {"poolclass": StaticPool}
+else:
+    pool_args = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+    }
+
 # Create database engine
-engine = create_engine(settings.database_url, connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {})
+engine = create_engine(
+    settings.database_url,
+    connect_args={"check_same_thread": False} if is_sqlite else {},
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    **pool_args
+)
+
+if is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+        # WAL lets the API read while a pipeline stage writes; writers wait for the
+        # lock for up to busy_timeout instead of failing with "database is locked"
+        cursor = dbapi_connection.cursor()
+        if not is_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.close()
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def sync_schema():
+    """
+    Create missing tables, then add columns and indexes that were introduced after
+    an existing table was created (create_all never alters existing tables).
+    New columns must be nullable.
+    """
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
 # Create all tables
-Base.metadata.create_all(bind=engine)
+sync_schema()
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    Session for one unit of pipeline work (a message or a batch), outside of FastAPI
+    dependencies. Rolled back if the block raises and always returned to the pool.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+# API routes run their queries here rather than on the event loop; the bound keeps
+# request bursts from claiming every pooled connection the pipeline stages need
+_api_db_executor = ThreadPoolExecutor(max_workers=settings.api_db_workers, thread_name_prefix="api-db")
+
+async def run_db(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Await `func(db, *args, **kwargs)`, run with its own session on the API database executor."""
+    def call():
+        with session_scope() as db:
+            return func(db, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_api_db_executor, call)
\ No newline at end of file
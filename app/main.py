@@ -1,20 +1,22 @@
-from typing import Dict, Set
+import asyncio
+from typing import Optional
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from app.utils.config import settings
 from app.utils.logging import setup_logging
 from app.api.v1.routes.health import router as health_router
 from app.api.v1.routes.ingestion import router as ingestor_router
-from app.database.db import engine
-from app.models.document import Base
+from app.database.db import run_db, sync_schema
 from app.agents.ingestor import start_ingestor
 from app.api.v1.routes.documents import router as documents_router
-from app.message_bus.bus import MessageBus
+from app.message_bus.bus import publisher_pool
 from app.agents.extractor import start_extractor
 from app.agents.classifier import start_classifier
 from app.agents.router import start_router
+from app.agents.runtime import bind_loop
+from app.services.change_log import read_changes
 from dotenv import load_dotenv, find_dotenv
-from app.utils.websocket import document_clients, mailbox_clients
+from app.utils.websocket import document_broadcaster, mailbox_broadcaster
 
 
 load_dotenv(find_dotenv())
@@ -34,6 +36,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include API routes
@@ -44,76 +47,63 @@ app.include_router(documents_router)
 
 # WebSocket endpoint for document status updates
 @app.websocket("/ws/documents")
-async def websocket_documents(websocket: WebSocket):
+async def websocket_documents(websocket: WebSocket, since: Optional[int] = None,
+                              status: Optional[str] = None, type: Optional[str] = None):
+    """
+    Live document updates, optionally only those with the given status/type. With
+    `since` (the last `seq` received), first replays what changed after it, or sends
+    {"reset": true, "seq": ...} when that is no longer possible and the client should
+    reload `GET /documents`.
+    """
     await websocket.accept()
-    document_clients.add(websocket)
+    filters = {name: value for name, value in (("status", status), ("type", type)) if value is not None}
+    # Live updates are queued while the missed ones are read, and sent after them
+    document_broadcaster.connect(websocket, filters, paused=since is not None)
     try:
+        if since is not None:
+            changes, seq, reset, more = await run_db(read_changes, since, status, type, settings.change_feed_replay_limit)
+            if reset or more:
+                document_broadcaster.replay(websocket, [(None, {"reset": True, "seq": seq})])
+            else:
+                document_broadcaster.replay(websocket, [(change["id"], change) for change in changes])
         while True:
             # Keep connection alive; clients can send pings if needed
             await websocket.receive_text()
     except WebSocketDisconnect:
-        document_clients.remove(websocket)
+        pass
+    finally:
+        document_broadcaster.disconnect(websocket)
 
 # WebSocket endpoint for mailbox connection updates
 @app.websocket("/ws/mailbox")
 async def websocket_mailbox(websocket: WebSocket):
     await websocket.accept()
-    mailbox_clients.add(websocket)
+    mailbox_broadcaster.connect(websocket)
     try:
         while True:
             # Keep connection alive
             await websocket.receive_text()
     except WebSocketDisconnect:
-        mailbox_clients.remove(websocket)
-
-async def broadcast_document_update(document: Dict):
-    message = {
-        "doc_id": document["doc_id"],
-        "status": document["status"],
-        "type": document.get("type"),
-        "confidence": document.get("confidence"),
-        "destination": document.get("destination"),
-        "last_updated": document["last_updated"],
-    }
-    disconnected_clients = set()
-    for client in document_clients:
-        try:
-            await client.send_json(message)
-        except:
-            disconnected_clients.add(client)
-    # Clean up disconnected clients
-    document_clients.difference_update(disconnected_clients)
-
-# Broadcast mailbox update to all connected mailbox clients
-async def broadcast_mailbox_update(config_id: str, status: str, message: str, doc_id: str = None):
-    message = {
-        "config_id": config_id,
-        "status": status,
-        "message": message,
-        "doc_id": doc_id,
-    }
-    disconnected_clients = set()
-    for client in mailbox_clients:
-        try:
-            await client.send_json(message)
-        except:
-            disconnected_clients.add(client)
-    # Clean up disconnected clients
-    mailbox_clients.difference_update(disconnected_clients)
+        pass
+    finally:
+        mailbox_broadcaster.disconnect(websocket)
 
 
 @app.on_event("startup")
 async def startup_event():
     # Create database tables
-    Base.metadata.create_all(bind=engine)
+    sync_schema()
     logger.info("Database tables created")
-    # Start Ingestor worker
-    start_ingestor()
-    start_extractor()
-    start_classifier()
-    start_router()
+    # Pipeline workers can instead run in their own processes (python -m app.agents)
+    if settings.run_workers_in_api:
+        bind_loop(asyncio.get_running_loop())
+        start_ingestor()
+        start_extractor()
+        start_classifier()
+        start_router()
     logger.info("Starting Document Ingestion System")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    publisher_pool.close()
     logger.info("Shutting down Document Ingestion System")
\ No newline at end of file
@@ -1,11 +1,32 @@
 import pika
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional
 from app.utils.config import settings
 from app.utils.logging import setup_logging
 
 logger = setup_logging()
 
+# Routing key each pipeline stage consumes
+PIPELINE_STAGES = {
+    "ingestor": "doc.initialize",
+    "extractor": "doc.received",
+    "classifier": "doc.text",
+    "router": "doc.type",
+}
+
+# Messages survive a broker restart when routed to a durable queue
+PERSISTENT = pika.BasicProperties(delivery_mode=2)
+
+def stage_queue(stage: str) -> str:
+    """Name of the durable queue shared by all consumers of a pipeline stage, across processes."""
+    # ".v2": the unsuffixed names were auto-delete queues, which a broker refuses to redeclare as durable
+    return f"document_pipeline.{stage}.v2"
+
 class MessageBus:
-    def __init__(self):
+    def __init__(self, confirm_delivery: bool = False):
         try:
             credentials = pika.PlainCredentials(settings.rabbitmq_user, settings.rabbitmq_password)
             parameters = pika.ConnectionParameters(
@@ -17,6 +38,9 @@ class MessageBus:
             self.channel = self.connection.channel()
             self.exchange = "document_exchange"
             self.channel.exchange_declare(exchange=self.exchange, exchange_type="topic")
+            if confirm_delivery:
+                # basic_publish now blocks until the broker confirms the message
+                self.channel.confirm_delivery()
             logger.info(f"Connected to RabbitMQ at {settings.rabbitmq_host}:{settings.rabbitmq_port}")
         except pika.exceptions.AMQPError as e:
             logger.error(f"Failed to connect to RabbitMQ: {e}")
@@ -27,18 +51,53 @@ class MessageBus:
             self.channel.basic_publish(
                 exchange=self.exchange,
                 routing_key=routing_key,
-                body=message
+                body=message,
+                properties=PERSISTENT
             )
             logger.info(f"Published message to exchange {self.exchange} with routing key {routing_key}")
         except pika.exceptions.AMQPError as e:
             logger.error(f"Failed to publish message to {routing_key}: {e}")
             raise
 
-    def subscribe(self, routing_key: str):
+    def publish_batch(self, routing_key: str, messages: List[str]):
+        """
+        Publish `messages` on a transactional channel so the broker acknowledges the whole
+        batch with a single commit (BlockingChannel confirms would wait on every message).
+        """
+        channel = self.connection.channel()
+        try:
+            channel.tx_select()
+            for message in messages:
+                channel.basic_publish(
+                    exchange=self.exchange,
+                    routing_key=routing_key,
+                    body=message,
+                    properties=PERSISTENT
+                )
+            channel.tx_commit()
+            logger.info(f"Published {len(messages)} messages to exchange {self.exchange} with routing key {routing_key}")
+        except pika.exceptions.AMQPError as e:
+            logger.error(f"Failed to publish batch to {routing_key}: {e}")
+            raise
+        finally:
+            if channel.is_open:
+                channel.close()
+
+    def subscribe(self, routing_key: str, queue_name: Optional[str] = None, prefetch_count: Optional[int] = None):
+        """
+        Bind a queue to `routing_key`. With `queue_name`, the queue is durable and every
+        subscriber (in any process) competes for its messages; otherwise each subscriber gets
+        its own exclusive queue. `prefetch_count` caps unacknowledged deliveries per consumer.
+        """
         try:
-            # Declare a unique queue for each subscriber
-            result = self.channel.queue_declare(queue="", exclusive=True)
-            queue_name = result.method.queue
+            if queue_name:
+                self.channel.queue_declare(queue=queue_name, durable=True)
+            else:
+                # Declare a unique queue for each subscriber
+                result = self.channel.queue_declare(queue="", exclusive=True)
+                queue_name = result.method.queue
+            if prefetch_count:
+                self.channel.basic_qos(prefetch_count=prefetch_count)
             self.channel.queue_bind(
                 exchange=self.exchange,
                 queue=queue_name,
@@ -50,6 +109,15 @@ class MessageBus:
             logger.error(f"Failed to subscribe to {routing_key}: {e}")
             raise
 
+    def declare_pipeline_queues(self):
+        """
+        Declare and bind every stage queue, so documents published before a stage's
+        workers first start are kept rather than dropped by the exchange.
+        """
+        for stage, routing_key in PIPELINE_STAGES.items():
+            self.channel.queue_declare(queue=stage_queue(stage), durable=True)
+            self.channel.queue_bind(exchange=self.exchange, queue=stage_queue(stage), routing_key=routing_key)
+
     def close(self):
         try:
             self.channel.close()
@@ -57,4 +125,150 @@ class MessageBus:
             logger.info("RabbitMQ connection closed")
         except pika.exceptions.AMQPError as e:
             logger.error(f"Failed to close RabbitMQ connection: {e}")
-            raise
\ No newline at end of file
+            raise
+
+class PublisherPool:
+    """
+    Thread-safe pool of long-lived publishing connections shared by the API routes, so a
+    request borrows an open channel instead of paying the TCP + AMQP handshake.
+    Connections that fail are discarded and replaced on the next borrow.
+    """
+
+    def __init__(self, max_size: int, acquire_timeout: float, confirm_delivery: bool):
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.confirm_delivery = confirm_delivery
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+        self._borrowed = 0
+        self._waited = 0
+        self._wait_seconds = 0.0
+        self._reconnects = 0
+        self._failures = 0
+        self._queues_declared = False
+
+    def _checkout(self) -> MessageBus:
+        while True:
+            try:
+                bus = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                # Services heartbeats that arrived while idle and detects dropped connections
+                bus.connection.process_data_events(time_limit=0)
+                if bus.channel.is_open:
+                    return bus
+            except pika.exceptions.AMQPError:
+                pass
+            self._discard(bus)
+            with self._lock:
+                self._reconnects += 1
+        bus = MessageBus(confirm_delivery=self.confirm_delivery)
+        with self._lock:
+            self._open += 1
+        if not self._queues_declared:
+            try:
+                bus.declare_pipeline_queues()
+            except pika.exceptions.AMQPError:
+                self._discard(bus)
+                raise
+            self._queues_declared = True
+        return bus
+
+    def _discard(self, bus: MessageBus):
+        with self._lock:
+            self._open -= 1
+        try:
+            bus.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def acquire(self):
+        """Borrow a MessageBus for the duration of the block."""
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError(f"No publisher connection available after {self.acquire_timeout}s")
+        waited = time.perf_counter() - started
+        bus = None
+        try:
+            bus = self._checkout()
+            with self._lock:
+                self._in_use += 1
+                self._borrowed += 1
+                self._wait_seconds += waited
+                if waited > 0.001:
+                    self._waited += 1
+            try:
+                yield bus
+            except pika.exceptions.AMQPError:
+                with self._lock:
+                    self._failures += 1
+                self._discard(bus)
+                bus = None
+                raise
+            finally:
+                with self._lock:
+                    self._in_use -= 1
+        finally:
+            if bus is not None:
+                self._idle.put(bus)
+            self._slots.release()
+
+    def _with_retry(self, action):
+        # A pooled connection may have been dropped by the broker since it was last used;
+        # retry once on a fresh connection before giving up
+        try:
+            with self.acquire() as bus:
+                return action(bus)
+        except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+            logger.warning(f"Publisher connection failed ({e}), reconnecting")
+            with self._lock:
+                self._reconnects += 1
+            with self.acquire() as bus:
+                return action(bus)
+
+    def publish(self, routing_key: str, message: str):
+        self._with_retry(lambda bus: bus.publish(routing_key, message))
+
+    def publish_batch(self, routing_key: str, messages: List[str]):
+        self._with_retry(lambda bus: bus.publish_batch(routing_key, messages))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "open_connections": self._open,
+                "idle": self._idle.qsize(),
+                "in_use": self._in_use,
+                "utilization": round(self._in_use / self.max_size, 4) if self.max_size else 0.0,
+                "borrowed": self._borrowed,
+                "waited": self._waited,
+                "avg_wait_ms": round(self._wait_seconds / self._borrowed * 1000, 3) if self._borrowed else 0.0,
+                "reconnects": self._reconnects,
+                "failures": self._failures,
+            }
+
+    def close(self):
+        while True:
+            try:
+                bus = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(bus)
+
+def create_publisher():
+    """Publisher for the configured `message_bus.backend` ("rabbitmq" or "memory")."""
+    if settings.message_bus_backend == "memory":
+        from app.message_bus.memory import memory_broker
+        return memory_broker
+    return PublisherPool(
+        max_size=settings.publisher_pool_size,
+        acquire_timeout=settings.publisher_pool_timeout,
+        confirm_delivery=settings.publisher_confirms
+    )
+
+publisher_pool = create_publisher()
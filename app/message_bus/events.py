@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Dict, Optional
+from app.services import text_store
 
 class DocReceivedEvent(BaseModel):
     doc_id: str
@@ -9,8 +10,19 @@ class DocReceivedEvent(BaseModel):
 
 class DocTextEvent(BaseModel):
     doc_id: str
-    text: str
+    # Small texts travel inline; larger ones only as a reference into the text store
+    text: Optional[str] = None
+    text_ref: Optional[str] = None
     entities: Dict
+    cache_key: Optional[str] = None
+    # Set when entities and classification came from one combined LLM call
+    classification: Optional[Dict] = None
+
+    def load_text(self) -> str:
+        """The extracted text, read from the text store when it was not sent inline."""
+        if self.text is not None:
+            return self.text
+        return text_store.get_text(self.text_ref)
 
 class DocTypeEvent(BaseModel):
     doc_id: str
@@ -0,0 +1,98 @@
+import asyncio
+import queue
+import threading
+from typing import Dict, List
+from app.message_bus.bus import PIPELINE_STAGES, stage_queue
+from app.utils.config import settings
+from app.utils.logging import setup_logging
+
+logger = setup_logging()
+
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    """AMQP topic matching: `*` matches exactly one word, `#` zero or more."""
+    def match(pattern_words: List[str], key_words: List[str]) -> bool:
+        if not pattern_words:
+            return not key_words
+        head, rest = pattern_words[0], pattern_words[1:]
+        if head == "#":
+            return any(match(rest, key_words[i:]) for i in range(len(key_words) + 1))
+        if not key_words:
+            return False
+        return (head == "*" or head == key_words[0]) and match(rest, key_words[1:])
+    return match(pattern.split("."), routing_key.split("."))
+
+class InMemoryBroker:
+    """
+    In-process stand-in for the RabbitMQ topic exchange `document_exchange`, used when
+    `message_bus.backend` is "memory". Named queues are bounded and thread-safe. `publish`
+    (used by the API) waits up to `publisher_pool_timeout` seconds for room in a full queue,
+    then fails; `publish_async` (used by the stages) waits as long as it takes, which holds
+    back the publishing stage until the next one catches up.
+    Offers the same publish/publish_batch/stats/close interface as the publisher pool.
+    """
+
+    def __init__(self, max_queue_size: int):
+        self.max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._queues: Dict[str, queue.Queue] = {}
+        self._bindings: Dict[str, List[str]] = {}
+        self._published = 0
+        self._dropped = 0
+        # Like declare_pipeline_queues: keep documents published before a stage starts
+        for stage, routing_key in PIPELINE_STAGES.items():
+            self.declare_queue(stage_queue(stage), routing_key)
+
+    def declare_queue(self, name: str, routing_key: str) -> queue.Queue:
+        with self._lock:
+            if name not in self._queues:
+                self._queues[name] = queue.Queue(maxsize=self.max_queue_size)
+                self._bindings[name] = []
+            if routing_key not in self._bindings[name]:
+                self._bindings[name].append(routing_key)
+            return self._queues[name]
+
+    def _targets(self, routing_key: str) -> List[queue.Queue]:
+        with self._lock:
+            targets = [
+                self._queues[name] for name, patterns in self._bindings.items()
+                if any(topic_matches(pattern, routing_key) for pattern in patterns)
+            ]
+            self._published += 1
+            if not targets:
+                self._dropped += 1
+        return targets
+
+    def publish(self, routing_key: str, message: str):
+        for target in self._targets(routing_key):
+            try:
+                target.put(message, timeout=settings.publisher_pool_timeout)
+            except queue.Full:
+                raise TimeoutError(f"In-memory queue for {routing_key} is full")
+
+    async def publish_async(self, routing_key: str, message: str, poll_interval: float = 0.01):
+        """Publish from a coroutine, waiting without a timeout (and without a thread) for room."""
+        for target in self._targets(routing_key):
+            while True:
+                try:
+                    target.put_nowait(message)
+                    break
+                except queue.Full:
+                    await asyncio.sleep(poll_interval)
+
+    def publish_batch(self, routing_key: str, messages: List[str]):
+        for message in messages:
+            self.publish(routing_key, message)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "published": self._published,
+                "unroutable": self._dropped,
+                "queues": {name: q.qsize() for name, q in self._queues.items()},
+            }
+
+    def close(self):
+        pass
+
+memory_broker = InMemoryBroker(settings.memory_queue_size)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import DDL, Column, Integer, String, Float, DateTime, Index, event
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -11,6 +11,52 @@ class Document(Base):
     status = Column(String, nullable=False)  # e.g., "ingested", "extracted", "classified", "routed"
     type = Column(String, nullable=True)     # e.g., "invoice", "contract"
     confidence = Column(Float, nullable=True)
+    type_source = Column(String, nullable=True)  # "llm", "rules", "model" (local classifier) or "override"
     destination = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True, index=True)  # SHA-256 of the stored file
+    text_ref = Column(String, nullable=True)  # extracted text in the text store
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Back the keyset-paginated listing (newest first), alone and per filter
+    __table_args__ = (
+        Index("ix_documents_updated_at_id", "updated_at", "id"),
+        Index("ix_documents_status_updated_at_id", "status", "updated_at", "id"),
+        Index("ix_documents_type_updated_at_id", "type", "updated_at", "id"),
+        Index("ix_documents_destination_updated_at_id", "destination", "updated_at", "id"),
+    )
+
+class DocumentChange(Base):
+    """
+    Change log behind the change feed: each committed document update appends the
+    document's resulting state under the next sequence number.
+    """
+    __tablename__ = "document_changes"
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    doc_id = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    type = Column(String, nullable=True)
+    confidence = Column(Float, nullable=True)
+    destination = Column(String, nullable=True)
+    changed_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_document_changes_doc_id_seq", "doc_id", "seq"),
+        # Never reuse the sequence numbers of pruned rows
+        {"sqlite_autoincrement": True},
+    )
+
+class DocumentChangeCounter(Base):
+    """
+    A single row that every transaction appending to the change log updates first. The
+    row lock it holds until commit serializes appends, so changes commit in `seq` order
+    and a reader that has seen a `seq` has seen every change before it.
+    """
+    __tablename__ = "document_change_counter"
+    id = Column(Integer, primary_key=True)
+    appends = Column(Integer, nullable=False, default=0)
+
+event.listen(
+    DocumentChangeCounter.__table__, "after_create",
+    DDL("INSERT INTO document_change_counter (id, appends) VALUES (1, 0)")
+)
@@ -0,0 +1,196 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+from app.utils.config import settings
+from app.utils.logging import setup_logging
+
+logger = setup_logging()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    cost_seconds REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS ix_cache_entries_lru ON cache_entries (namespace, accessed_at);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    namespace TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    saved_seconds REAL NOT NULL DEFAULT 0
+);
+"""
+
+class DiskCache:
+    """
+    Bounded key/value cache persisted in a SQLite file.
+    Values are JSON-serialisable dicts. Entries expire after `ttl_seconds` and the least
+    recently used ones are evicted once `max_entries` or `max_bytes` is exceeded.
+    Hit/miss counters live in the same file, so they are shared by every process using it.
+    """
+
+    def __init__(self, path: str, namespace: str, max_entries: int, max_bytes: int, ttl_seconds: int, enabled: bool = True):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    self._initialized = True
+            conn.execute("INSERT OR IGNORE INTO cache_stats (namespace) VALUES (?)", (self.namespace,))
+            self._local.conn = conn
+        return conn
+
+    def _record(self, conn: sqlite3.Connection, hit: bool, saved_seconds: float = 0.0):
+        if hit:
+            conn.execute(
+                "UPDATE cache_stats SET hits = hits + 1, saved_seconds = saved_seconds + ? WHERE namespace = ?",
+                (saved_seconds, self.namespace)
+            )
+        else:
+            conn.execute("UPDATE cache_stats SET misses = misses + 1 WHERE namespace = ?", (self.namespace,))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled or not key:
+            return None
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, cost_seconds, created_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            now = time.time()
+            if row and self.ttl_seconds and now - row[2] > self.ttl_seconds:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+                row = None
+            if row is None:
+                self._record(conn, hit=False)
+                return None
+            conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key)
+            )
+            self._record(conn, hit=True, saved_seconds=row[1])
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Cache lookup failed in {self.namespace} for {key}: {e}")
+            return None
+
+    def set(self, key: str, value: Dict[str, Any], cost_seconds: float = 0.0):
+        """
+        Store `value` under `key`. `cost_seconds` is how long it took to compute and is
+        credited to `saved_seconds` on every later hit.
+        """
+        if not self.enabled or not key:
+            return
+        try:
+            conn = self._connect()
+            payload = json.dumps(value)
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, size, cost_seconds, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, payload, len(payload), cost_seconds, now, now)
+            )
+            self._evict(conn, now)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"Cache store failed in {self.namespace} for {key}: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        if self.ttl_seconds:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND created_at < ?",
+                (self.namespace, now - self.ttl_seconds)
+            )
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+            (self.namespace,)
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        # Walk from the least recently used entry until both limits are satisfied
+        victims = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY accessed_at ASC",
+            (self.namespace,)
+        ):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((self.namespace, key))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", victims)
+        logger.info(f"Evicted {len(victims)} entries from cache {self.namespace}")
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            conn = self._connect()
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+                (self.namespace,)
+            ).fetchone()
+            hits, misses, saved_seconds = conn.execute(
+                "SELECT hits, misses, saved_seconds FROM cache_stats WHERE namespace = ?",
+                (self.namespace,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read cache stats for {self.namespace}: {e}")
+            return {"enabled": self.enabled, "error": str(e)}
+        lookups = hits + misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "bytes": size,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "saved_seconds": round(saved_seconds, 3),
+        }
+
+def _result_cache(namespace: str, max_entries: int = None) -> DiskCache:
+    return DiskCache(
+        path=settings.result_cache_path,
+        namespace=namespace,
+        max_entries=max_entries or settings.result_cache_max_entries,
+        max_bytes=settings.result_cache_max_bytes,
+        ttl_seconds=settings.result_cache_ttl_seconds,
+        enabled=settings.result_cache_enabled
+    )
+
+# Extracted text + entities, and classification results, keyed by document content hash
+extraction_cache = _result_cache("extraction")
+classification_cache = _result_cache("classification")
+
+# Vision summaries keyed by the embedded image's bytes, shared across documents
+vision_cache = _result_cache("vision", max_entries=settings.vision_cache_max_entries)
+vision_cache.enabled = settings.result_cache_enabled and settings.vision_cache_enabled
+
+# Raw LLM replies keyed by a hash of the full request (model, messages, parameters)
+prompt_cache = _result_cache("prompts", max_entries=settings.prompt_cache_max_entries)
+prompt_cache.enabled = settings.result_cache_enabled and settings.prompt_cache_enabled
+prompt_cache.ttl_seconds = settings.prompt_cache_ttl_seconds
\ No newline at end of file
@@ -0,0 +1,116 @@
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+from app.models.document import Document, DocumentChange, DocumentChangeCounter
+from app.utils.config import settings
+
+# Old changes are pruned once per this many new ones
+PRUNE_EVERY = 1000
+# Keeps IN (...) lists well below database parameter limits
+_CHUNK = 500
+
+def change_to_dict(change) -> Dict:
+    return {
+        "seq": change.seq,
+        "id": change.doc_id,
+        "status": change.status,
+        "type": change.type,
+        "confidence": change.confidence,
+        "destination": change.destination,
+        "updated_at": change.changed_at.isoformat(),
+    }
+
+def record_changes(db: Session, doc_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Append the current state of `doc_ids` to the change log in the caller's transaction
+    (call it after the updates, before the commit). Returns each document's state with
+    its sequence number, name and creation time, keyed by id: the payload of a
+    document update notification. Appends are serialized: a concurrent caller waits here
+    until this transaction ends.
+    """
+    if not doc_ids:
+        return {}
+    db.execute(
+        update(DocumentChangeCounter).where(DocumentChangeCounter.id == 1)
+        .values(appends=DocumentChangeCounter.appends + 1)
+    )
+    rows = []
+    for start in range(0, len(doc_ids), _CHUNK):
+        rows += db.execute(
+            select(Document.id, Document.name, Document.status, Document.type, Document.confidence,
+                   Document.destination, Document.created_at, Document.updated_at)
+            .where(Document.id.in_(doc_ids[start:start + _CHUNK]))
+        ).all()
+    if not rows:
+        return {}
+    values = [
+        {"doc_id": row.id, "status": row.status, "type": row.type, "confidence": row.confidence,
+         "destination": row.destination, "changed_at": row.updated_at}
+        for row in rows
+    ]
+    seqs = db.execute(
+        insert(DocumentChange).returning(DocumentChange.seq, sort_by_parameter_order=True), values
+    ).scalars().all()
+
+    changes = {}
+    for seq, value, row in zip(seqs, values, rows):
+        changes[value["doc_id"]] = {
+            **change_to_dict(DocumentChange(seq=seq, **value)),
+            "name": row.name,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+        }
+    if settings.change_log_retention > 0 and seqs[-1] // PRUNE_EVERY != (seqs[0] - 1) // PRUNE_EVERY:
+        db.execute(delete(DocumentChange).where(DocumentChange.seq <= seqs[-1] - settings.change_log_retention))
+    return changes
+
+def read_changes(db: Session, since: int, status: Optional[str], type: Optional[str],
+                 limit: int) -> Tuple[List[Dict], int, bool, bool]:
+    """
+    Changes after `since`, only the latest per document, oldest first and optionally
+    filtered by the document's new status/type. Returns (changes, seq, reset, more):
+    resume from `seq` next time; `reset` means changes after `since` were already pruned
+    (or the log was recreated) and the client must reload the full list instead.
+    """
+    oldest, latest = db.execute(select(func.min(DocumentChange.seq), func.max(DocumentChange.seq))).one()
+    latest = latest or 0
+    if since > latest or (oldest is not None and since < oldest - 1):
+        return [], latest, True, False
+
+    latest_per_document = (
+        select(func.max(DocumentChange.seq))
+        .where(DocumentChange.seq > since)
+        .group_by(DocumentChange.doc_id)
+    )
+    query = select(DocumentChange).where(DocumentChange.seq.in_(latest_per_document))
+    if status is not None:
+        query = query.where(DocumentChange.status == status)
+    if type is not None:
+        query = query.where(DocumentChange.type == type)
+    changes = db.execute(query.order_by(DocumentChange.seq).limit(limit + 1)).scalars().all()
+
+    more = len(changes) > limit
+    changes = [change_to_dict(change) for change in changes[:limit]]
+    # Changes skipped by the filters need not be read again
+    seq = changes[-1]["seq"] if more else max(latest, changes[-1]["seq"] if changes else 0)
+    return changes, seq, False, more
+
+# Long-polls waiting in this process for the next change
+_waiters: Set[asyncio.Future] = set()
+
+def notify_changes():
+    """Wake local long-polls; call from the event loop after new changes are committed."""
+    for waiter in list(_waiters):
+        if not waiter.done():
+            waiter.set_result(None)
+
+async def wait_for_changes(timeout: float):
+    """Return after `notify_changes` is called or `timeout` seconds, whichever comes first."""
+    waiter = asyncio.get_running_loop().create_future()
+    _waiters.add(waiter)
+    try:
+        await asyncio.wait_for(waiter, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        _waiters.discard(waiter)
@@ -1,30 +1,127 @@
 import os
+import hashlib
 import mimetypes
-from typing import List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+from typing import Dict, List, Tuple
 from openai import AzureOpenAI
 from PIL import Image
 from io import BytesIO
 import base64
+import json
 from docx import Document
 import fitz  # PyMuPDF
+from app.utils.config import settings
+from app.services.cache import prompt_cache, vision_cache
+from app.services.rate_limit import llm_limiter
+from app.services.tokens import count_tokens, representative_excerpt, split_into_chunks
+from app.utils.logging import setup_logging
+
+logger = setup_logging()
 
 llm = AzureOpenAI(
     api_key=os.getenv("AZURE_OPENAI_KEY"),
     api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
     azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
     azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+    # Retries go through llm_limiter so they respect the shared limits
+    max_retries=0,
 )
 
-def encode_image_to_base64(image: Image.Image) -> str:
+# Rough input cost of one image part at the sizes prepare_image_for_vision produces
+IMAGE_TOKENS = 1000
+
+def estimate_prompt_tokens(messages: List[Dict], max_tokens: int) -> int:
+    tokens = max_tokens
+    for message in messages:
+        content = message["content"]
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        for part in parts:
+            tokens += count_tokens(part["text"]) if part["type"] == "text" else IMAGE_TOKENS
+    return tokens
+
+def prompt_cache_key(request: Dict) -> str:
+    payload = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _complete(messages: List[Dict], max_tokens: int, **kwargs) -> str:
+    """
+    Every chat completion goes through here: identical requests are answered from the
+    prompt cache, the rest wait behind the shared rate limiter.
+    """
+    request = {"model": "gpt-4o", "messages": messages, "max_tokens": max_tokens, **kwargs}
+    key = prompt_cache_key({**request, "deployment": os.getenv("AZURE_OPENAI_DEPLOYMENT")})
+    cached = prompt_cache.get(key)
+    if cached:
+        return cached["content"]
+    started = time.perf_counter()
+    response = llm_limiter.call(
+        lambda: llm.chat.completions.create(**request),
+        tokens=estimate_prompt_tokens(messages, max_tokens)
+    )
+    content = response.choices[0].message.content.strip()
+    # Truncated replies are not worth replaying
+    if response.choices[0].finish_reason == "stop":
+        prompt_cache.set(key, {"content": content}, cost_seconds=time.perf_counter() - started)
+    return content
+
+# Caps in-flight vision calls across every document being extracted in this process
+_vision_slots = BoundedSemaphore(settings.vision_global_concurrency)
+
+def prepare_image_for_vision(image: Image.Image) -> Image.Image:
+    """
+    Downscale to `vision_max_long_edge`, flatten transparency onto white and convert
+    to a mode the configured output format can store (optionally grayscale).
+    """
+    max_edge = settings.vision_max_long_edge
+    if max_edge and max(image.size) > max_edge:
+        scale = max_edge / max(image.size)
+        target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        # JPEG sources can be decoded directly at a reduced scale
+        image.draft("RGB", target)
+        image = image.resize(target, Image.LANCZOS) if image.size != target else image
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        # Flatten onto white; dropping alpha would turn transparent areas black
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    mode = "L" if settings.vision_grayscale else "RGB"
+    if image.mode != mode:
+        image = image.convert(mode)
+    return image
+
+def _encode_image(image: Image.Image, image_format: str, quality: int) -> BytesIO:
     buffered = BytesIO()
-    image.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    return f"data:image/png;base64,{img_str}"
+    if image_format == "PNG":
+        image.save(buffered, format=image_format, optimize=True)
+    else:
+        image.save(buffered, format=image_format, quality=quality)
+    return buffered
+
+def encode_image_to_base64(image: Image.Image) -> str:
+    """
+    Encode as a data URL in `vision_image_format`, lowering quality and then size
+    until the encoded image fits in `vision_max_image_bytes`.
+    """
+    image_format = settings.vision_image_format.upper()
+    quality = settings.vision_image_quality
+    buffered = _encode_image(image, image_format, quality)
+    while buffered.getbuffer().nbytes > settings.vision_max_image_bytes:
+        if image_format != "PNG" and quality > 40:
+            quality -= 15
+        elif min(image.size) > 256:
+            image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.LANCZOS)
+        else:
+            break
+        buffered = _encode_image(image, image_format, quality)
+    # b64encode reads the buffer in place instead of copying it out with getvalue()
+    img_str = base64.b64encode(buffered.getbuffer()).decode("ascii")
+    return f"data:image/{image_format.lower()};base64,{img_str}"
 
 def extract_entities(text: str) -> str:
     # return '{\"key\": \"LLM Response\"}'
-    response = llm.chat.completions.create(
-        model="gpt-4o",
+    return _complete(
         messages=[
             {"role": "system", 
              "content": """You are an expert in extracting structured entities from email content.
@@ -50,10 +147,73 @@ def extract_entities(text: str) -> str:
         ],
         max_tokens=500
     )
-    return response.choices[0].message.content.strip()
+
+def _merge_key(value) -> str:
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    return json.dumps(value, sort_keys=True)
+
+def merge_entities(results: List[Dict]) -> Dict:
+    """
+    Combine per-chunk entity extractions: list values are concatenated without
+    duplicates (ignoring case and spacing), and "Other Entities" keys found with
+    different values in several chunks keep every distinct value. "Other Entities"
+    returned as a list or a single value is merged under its "items" key.
+    """
+    merged: Dict = {"Dates": [], "Parties": [], "Amounts": [], "Other Entities": {}}
+    seen: Dict[str, set] = {}
+    for result in results:
+        if not isinstance(result, dict):
+            logger.warning(f"Skipping entities that are not a JSON object: {type(result).__name__}")
+            continue
+        for key, values in result.items():
+            if key == "Other Entities":
+                if values is None:
+                    continue
+                if not isinstance(values, dict):
+                    values = {"items": values if isinstance(values, list) else [values]}
+                others = merged["Other Entities"]
+                for name, value in values.items():
+                    if name not in others:
+                        others[name] = value
+                        continue
+                    existing = others[name] if isinstance(others[name], list) else [others[name]]
+                    additions = value if isinstance(value, list) else [value]
+                    known = {_merge_key(item) for item in existing}
+                    existing += [item for item in additions if _merge_key(item) not in known]
+                    others[name] = existing[0] if len(existing) == 1 else existing
+                continue
+            target = merged.setdefault(key, [])
+            keys = seen.setdefault(key, {_merge_key(item) for item in target})
+            for value in values if isinstance(values, list) else [values]:
+                if _merge_key(value) not in keys:
+                    keys.add(_merge_key(value))
+                    target.append(value)
+    return merged
+
+def extract_document_entities(text: str) -> Dict:
+    """
+    Entities of a document of any length. Text over `llm_chunk_tokens` is split into
+    chunks extracted in parallel (up to `llm_chunk_concurrency` calls) and merged.
+    """
+    chunks = split_into_chunks(text, settings.llm_chunk_tokens)
+    if len(chunks) == 1:
+        return parse_json_response(extract_entities(text))
+    workers = min(settings.llm_chunk_concurrency, len(chunks))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="entities") as executor:
+        replies = list(executor.map(extract_entities, chunks))
+    results = []
+    for index, reply in enumerate(replies):
+        try:
+            results.append(parse_json_response(reply))
+        except ValueError:
+            logger.warning(f"Skipping unparseable entities for chunk {index + 1} of {len(chunks)}")
+    return merge_entities(results)
 
 def classify_document(text: str, entities: str = None) -> str:
     # return '{\"category\": \"contract\", \"confidence_score\":80}'
+    # A bounded excerpt is enough to tell contracts from invoices
+    text = representative_excerpt(text, settings.llm_classification_max_tokens)
     messages = [
         {"role": "system", 
         "content": """You are an expert in extracting structured entities from email content.
@@ -74,12 +234,78 @@ def classify_document(text: str, entities: str = None) -> str:
     ]
     # if entities:
     #     messages.append({"role": "user", "content": entities})
-    response = llm.chat.completions.create(
-        model="gpt-4o",
+    return _complete(
         messages=messages,
         max_tokens=500
     )
-    return response.choices[0].message.content.strip()
+
+def classify_documents_batch(documents: List[Tuple[str, str, str]]) -> str:
+    """
+    Classify several short documents, given as (doc_id, text, entities), in one prompt.
+    The reply is a JSON object with one result per doc_id.
+    """
+    content = "\n\n".join(
+        f"### Document {doc_id}\nText: {text}\nEntities: {entities}"
+        for doc_id, text, entities in documents
+    )
+    return _complete(
+        messages=[
+            {"role": "system",
+             "content": """You are an expert in classifying documents received by email.
+                            The user message contains several documents, each starting with a "### Document <doc_id>" line.
+                            Classify every document independently:
+                            category: The category of the document (e.g., contract, invoice, letter).
+                            confidence_score: The confidence score of the classification (0-100).
+                            Return a JSON object with exactly one result per document, using its doc_id:
+                            {
+                                "results": [
+                                    {"doc_id": "", "category": "", "confidence_score": 0}
+                                ]
+                            }"""},
+            {"role": "user", "content": content}
+        ],
+        response_format={"type": "json_object"},
+        max_tokens=100 + 60 * len(documents)
+    )
+
+def parse_json_response(content: str) -> dict:
+    """Parse a model reply that should be a JSON object, tolerating a ```json fence."""
+    return json.loads(content.strip().removeprefix("```json").removesuffix("```").strip())
+
+def analyze_document(text: str) -> dict:
+    """
+    Entities and classification from a single JSON-mode call, so the document text is
+    uploaded once. Returns {"entities": {...}, "category": ..., "confidence_score": ...}.
+    """
+    return parse_json_response(_complete(
+        messages=[
+            {"role": "system",
+             "content": """You are an expert in analysing documents received by email.
+                            From the given content:
+                            1. Extract the entities:
+                            Dates: All relevant dates mentioned.
+                            Parties: Names of individuals, companies, or organizations.
+                            Amounts: All monetary values with currency symbols.
+                            Other Entities: Any additional relevant information (like Invoice No, VAT No, IBAN, BIC, etc.)
+                            2. Classify the document:
+                            category: The category of the given content (e.g., contract, invoice, letter).
+                            confidence_score: The confidence score of the classification (0-100).
+                            Return a JSON object with this structure:
+                            {
+                                "entities": {
+                                    "Dates": [],
+                                    "Parties": [],
+                                    "Amounts": [],
+                                    "Other Entities": {}
+                                },
+                                "category": "",
+                                "confidence_score": 0
+                            }"""},
+            {"role": "user", "content": text}
+        ],
+        response_format={"type": "json_object"},
+        max_tokens=800
+    ))
 
 def summarize_email_body(text: str) -> str:
     return text
@@ -87,26 +313,104 @@ def summarize_email_body(text: str) -> str:
 def summarize_image_with_vision(image: Image.Image) -> str:
     # return "LLM Response"
     encoded_image = encode_image_to_base64(image)
-    response = llm.chat.completions.create(
-        model="gpt-4o",
+    return _complete(
         messages=[
             {"role": "system", "content": "You are a document analysis assistant. Explain what's in this image."},
             {"role": "user", "content": [{"type": "image_url", "image_url": {"url": encoded_image}}]}
         ],
         max_tokens=500
     )
-    return response.choices[0].message.content.strip()
+
+def _summarize_image_in_slot(image: Image.Image) -> str:
+    # Identical image bytes (letterheads, logos) reuse the summary from earlier documents
+    content_hash = image.info.get("sha256")
+    cached = vision_cache.get(content_hash)
+    if cached:
+        return cached["summary"]
+    started = time.perf_counter()
+    image = prepare_image_for_vision(image)
+    with _vision_slots:
+        summary = summarize_image_with_vision(image)
+    vision_cache.set(content_hash, {"summary": summary}, cost_seconds=time.perf_counter() - started)
+    return summary
+
+def summarize_images(images: List[Image.Image]) -> List[str]:
+    """
+    Summarize images concurrently and return the summaries in the original order.
+    At most `vision_document_concurrency` calls run for one document, and
+    `vision_global_concurrency` across all documents.
+    """
+    if len(images) <= 1:
+        return [_summarize_image_in_slot(image) for image in images]
+    workers = min(settings.vision_document_concurrency, len(images))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vision") as executor:
+        return list(executor.map(_summarize_image_in_slot, images))
+
+def perceptual_hash(image: Image.Image) -> int:
+    """
+    64-bit difference hash: compares neighbouring pixels of a 9x8 grayscale thumbnail,
+    so re-encoded or slightly rescaled copies of an image hash to (nearly) the same value.
+    """
+    pixels = image.convert("L").resize((9, 8), Image.BILINEAR).tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+def is_decorative_image(width: int, height: int) -> bool:
+    return min(width, height) < settings.vision_min_image_size
+
+class ImageDeduplicator:
+    """
+    Tracks the images already kept for one document, by exact content and, for images
+    up to `vision_dedup_max_edge` (logos, stamps, signatures), by perceptual hash.
+    Full-page scans are only matched exactly: text pages all shrink to nearly the same
+    white thumbnail, so their perceptual hashes cannot tell them apart.
+    """
+
+    def __init__(self):
+        self._digests = set()
+        self._fingerprints = []
+
+    def load(self, img_bytes: bytes):
+        """
+        Decode `img_bytes` and return the image, or None if it is tiny or a repeat.
+        The content digest is kept in `image.info["sha256"]` for the cross-document cache.
+        """
+        digest = hashlib.sha256(img_bytes).hexdigest()
+        if digest in self._digests:
+            return None
+        self._digests.add(digest)
+
+        image = Image.open(BytesIO(img_bytes))
+        if is_decorative_image(*image.size):
+            return None
+        if max(image.size) <= settings.vision_dedup_max_edge:
+            fingerprint = perceptual_hash(image)
+            if any((fingerprint ^ seen).bit_count() <= settings.vision_dedup_max_distance for seen in self._fingerprints):
+                return None
+            self._fingerprints.append(fingerprint)
+        image.info["sha256"] = digest
+        return image
 
 def extract_images_from_pdf(pdf_path: str):
     images = []
+    seen_xrefs = set()
+    deduplicator = ImageDeduplicator()
     doc = fitz.open(pdf_path)
     for page in doc:
         for img_index, img in enumerate(page.get_images(full=True)):
-            xref = img[0]
+            xref, width, height = img[0], img[2], img[3]
+            # The same embedded object (e.g. a letterhead) is listed once per page
+            if xref in seen_xrefs or is_decorative_image(width, height):
+                continue
+            seen_xrefs.add(xref)
             base_image = doc.extract_image(xref)
             img_bytes = base_image["image"]
-            image = Image.open(BytesIO(img_bytes))
-            images.append(image)
+            image = deduplicator.load(img_bytes)
+            if image is not None:
+                images.append(image)
     return images
 
 def extract_text_from_pdf(pdf_path: str) -> str:
@@ -122,13 +426,15 @@ def extract_text_from_docx(docx_path: str) -> str:
 
 def extract_images_from_docx(docx_path: str):
     images = []
+    deduplicator = ImageDeduplicator()
     doc = Document(docx_path)
     for rel in doc.part._rels:
         rel = doc.part._rels[rel]
         if "image" in rel.target_ref:
             image_data = rel.target_part.blob
-            image = Image.open(BytesIO(image_data))
-            images.append(image)
+            image = deduplicator.load(image_data)
+            if image is not None:
+                images.append(image)
     return images
 
 def is_image_file(file_path: str) -> bool:
@@ -139,7 +445,7 @@ def process_file(file_path: str) -> str:
     if is_image_file(file_path):
         print("Detected image file.")
         img = Image.open(file_path)
-        return summarize_image_with_vision(img)
+        return summarize_image_with_vision(prepare_image_for_vision(img))
 
     images = []
     extracted_text = ""
@@ -161,10 +467,9 @@ def process_file(file_path: str) -> str:
         print("Extracted text...")
         summaries.append(extracted_text)
 
-    for idx, image in enumerate(images):
-        print(f"Summarizing image {idx+1}...")
-        summary = summarize_image_with_vision(image)
-        summaries.append(summary)
+    if images:
+        print(f"Summarizing {len(images)} images...")
+        summaries.extend(summarize_images(images))
 
     return "\n".join(summaries)
 
@@ -0,0 +1,256 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+import openai
+from app.utils.config import settings
+from app.utils.logging import setup_logging
+
+logger = setup_logging()
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most one minute's worth."""
+
+    def __init__(self, name: str, per_minute: int):
+        self.name = name
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, amount: float) -> float:
+        """Take `amount` and return 0, or return how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._level >= amount:
+                self._level -= amount
+                return 0.0
+            return (amount - self._level) / self.rate
+
+    def acquire(self, amount: float):
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        while True:
+            wait = self._take(amount)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def level(self) -> float:
+        with self._lock:
+            return min(self.capacity, self._level + (time.monotonic() - self._updated) * self.rate)
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket kept in a SQLite file, so every process on the host shares one budget.
+    """
+
+    def __init__(self, name: str, per_minute: int, path: str):
+        super().__init__(name, per_minute)
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _take(self, amount: float) -> float:
+        conn = self._connect()
+        # BEGIN IMMEDIATE serializes the read-modify-write across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT level, updated_at FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+            level = self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.rate)
+            wait = 0.0
+            if level >= amount:
+                level -= amount
+            else:
+                wait = (amount - level) / self.rate
+            conn.execute(
+                "INSERT OR REPLACE INTO token_buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                (self.name, level, now)
+            )
+            conn.execute("COMMIT")
+            return wait
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def level(self) -> float:
+        row = self._connect().execute(
+            "SELECT level, updated_at FROM token_buckets WHERE name = ?", (self.name,)
+        ).fetchone()
+        if row is None:
+            return self.capacity
+        return min(self.capacity, row[0] + (time.time() - row[1]) * self.rate)
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on concurrent calls: +1/limit per healthy call (about +1 per round of calls),
+    halved on a 429 and cut by 10% when a call takes `spike_factor` times the usual latency.
+    Decreases are at most one per typical call duration, so a burst of 429s from the same
+    round of calls counts once.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, spike_factor: float):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.spike_factor = spike_factor
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self._decrease(0.5, now)
+            elif latency is not None:
+                if self._baseline and latency > self.spike_factor * self._baseline:
+                    self._decrease(0.9, now)
+                elif self.in_flight + 1 >= int(self.limit):
+                    # Only grow a limit that is actually reached, or it drifts up while the buckets are what binds
+                    self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                # Moving average of healthy and slow calls alike, so a lasting slowdown becomes the new normal
+                self._baseline = latency if self._baseline is None else 0.9 * self._baseline + 0.1 * latency
+            self._cond.notify_all()
+
+    def _decrease(self, factor: float, now: float):
+        if now - self._last_decrease < (self._baseline or 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * factor)
+
+class LLMLimiter:
+    """
+    Admission control in front of Azure OpenAI: request and token buckets, then the
+    adaptive concurrency limit. Rate-limited and transient failures are retried here
+    (the SDK's own retries are disabled) so retries also pass through the limits.
+    """
+
+    def __init__(self):
+        path = settings.llm_rate_limit_path
+        bucket = (lambda name, per_minute: SharedTokenBucket(name, per_minute, path)) if path else TokenBucket
+        self.requests = bucket("requests", settings.llm_requests_per_minute) if settings.llm_requests_per_minute > 0 else None
+        self.tokens = bucket("tokens", settings.llm_tokens_per_minute) if settings.llm_tokens_per_minute > 0 else None
+        self.concurrency = AdaptiveConcurrency(
+            initial=settings.llm_initial_concurrency,
+            minimum=settings.llm_min_concurrency,
+            maximum=settings.llm_max_concurrency,
+            spike_factor=settings.llm_latency_spike_factor
+        )
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self._calls = 0
+        self._throttled = 0
+        self._retries = 0
+        self._failures = 0
+        self._wait_seconds = 0.0
+
+    def _admit(self, tokens: int):
+        started = time.perf_counter()
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens:
+            self.tokens.acquire(tokens)
+        self.concurrency.acquire()
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._calls += 1
+            self._wait_seconds += waited
+            self._waits.append(waited)
+
+    def _backoff(self, error: Exception, attempt: int) -> float:
+        response = getattr(error, "response", None)
+        headers = response.headers if response is not None else {}
+        try:
+            if "retry-after-ms" in headers:
+                return float(headers["retry-after-ms"]) / 1000
+            if "retry-after" in headers:
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return min(30.0, 0.5 * 2 ** attempt)
+
+    def call(self, func: Callable, tokens: int):
+        """Run `func` (one LLM request estimated at `tokens` tokens) once admitted."""
+        attempt = 0
+        while True:
+            self._admit(tokens)
+            started = time.perf_counter()
+            try:
+                result = func()
+            except openai.RateLimitError as e:
+                self.concurrency.release(throttled=True)
+                with self._lock:
+                    self._throttled += 1
+                error = e
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                self.concurrency.release()
+                error = e
+            except Exception:
+                self.concurrency.release()
+                with self._lock:
+                    self._failures += 1
+                raise
+            else:
+                self.concurrency.release(latency=time.perf_counter() - started)
+                return result
+
+            if attempt >= settings.llm_max_retries:
+                with self._lock:
+                    self._failures += 1
+                raise error
+            delay = self._backoff(error, attempt)
+            logger.warning(f"LLM call failed ({type(error).__name__}), retrying in {delay:.1f}s")
+            with self._lock:
+                self._retries += 1
+            attempt += 1
+            time.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            calls, wait_seconds = self._calls, self._wait_seconds
+            counters = {"throttled": self._throttled, "retries": self._retries, "failures": self._failures}
+        return {
+            "calls": calls,
+            **counters,
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "requests_available": round(self.requests.level(), 1) if self.requests else None,
+            "tokens_available": round(self.tokens.level()) if self.tokens else None,
+            "queue_delay_ms": {
+                "avg": round(wait_seconds / calls * 1000, 3) if calls else 0.0,
+                "p50": round(waits[len(waits) // 2] * 1000, 3) if waits else 0.0,
+                "p95": round(waits[int(len(waits) * 0.95)] * 1000, 3) if waits else 0.0,
+                "max": round(waits[-1] * 1000, 3) if waits else 0.0,
+            },
+        }
+
+llm_limiter = LLMLimiter()
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import bindparam, case, or_, update
+from app.database.db import session_scope
+from app.services.change_log import record_changes
+from app.models.document import Document
+from app.utils.config import settings
+from app.utils.logging import setup_logging
+
+logger = setup_logging()
+
+# Pipeline order; a document's status never moves backwards through the writer
+STATUS_ORDER = ["ingested", "extracted", "classified", "routed"]
+
+def status_rank(status: str) -> int:
+    return STATUS_ORDER.index(status) if status in STATUS_ORDER else -1
+
+def _resolve(future: Future, result: Any = None, error: BaseException = None):
+    # A stage coroutine cancelled while waiting cancels its future (asyncio.wrap_future)
+    if future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        # Cancelled between the check and now
+        pass
+
+class StatusWriter:
+    """
+    Coalesces document updates from every stage in the process and writes them as
+    batched UPDATEs in one transaction, every `flush_interval` seconds or once
+    `batch_size` documents are pending. Later fields win per document; the status only
+    moves forward, both among pending updates and against the stored row.
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._waiters: Dict[str, List[Future]] = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._updates = 0
+        self._rows = 0
+        self._flushes = 0
+        self._flush_seconds = 0.0
+
+    def update(self, doc_id: str, status: str, **fields) -> Future:
+        """
+        Queue an update. The future resolves, once it is committed, to the document's
+        resulting state and change `seq`, for notifications.
+        """
+        future = Future()
+        with self._cond:
+            pending = self._pending.get(doc_id, {})
+            if status_rank(pending.get("status")) > status_rank(status):
+                status = pending["status"]
+            self._pending[doc_id] = {**pending, **fields, "status": status, "updated_at": datetime.utcnow()}
+            self._waiters.setdefault(doc_id, []).append(future)
+            self._updates += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="status-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def _run(self):
+        # The thread is started once, so nothing may end it: every later update would hang
+        while True:
+            try:
+                self._write_next_batch()
+            except Exception as e:
+                logger.error(f"Status writer failed to complete a batch: {e}")
+
+    def _write_next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Give concurrent stages a moment to add to this batch
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._pending) < self.batch_size and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            batch, self._pending = self._pending, {}
+            waiters, self._waiters = self._waiters, {}
+        started = time.perf_counter()
+        try:
+            changes = self._flush(batch)
+        except Exception as e:
+            logger.error(f"Failed to write status of {len(batch)} documents: {e}")
+            for futures in waiters.values():
+                for future in futures:
+                    _resolve(future, error=e)
+            return
+        with self._cond:
+            self._rows += len(batch)
+            self._flushes += 1
+            self._flush_seconds += time.perf_counter() - started
+        for doc_id, futures in waiters.items():
+            # Missing only if the row was deleted meanwhile
+            written = changes.get(doc_id) or {
+                "id": doc_id, "status": batch[doc_id]["status"], "updated_at": batch[doc_id]["updated_at"].isoformat()
+            }
+            for future in futures:
+                _resolve(future, result=written)
+
+    def _flush(self, batch: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        # executemany needs the same columns in every row, so group by status and fields
+        groups: Dict[Tuple[str, Tuple[str, ...]], List[Dict[str, Any]]] = {}
+        for doc_id, values in batch.items():
+            key = (values["status"], tuple(sorted(name for name in values if name != "status")))
+            groups.setdefault(key, []).append({"b_id": doc_id, **{f"b_{name}": value for name, value in values.items()}})
+
+        table = Document.__table__
+        with session_scope() as db:
+            for (status, names), rows in groups.items():
+                later = STATUS_ORDER[status_rank(status) + 1:] if status_rank(status) >= 0 else []
+                values = {name: bindparam(f"b_{name}") for name in names}
+                values["status"] = bindparam("b_status")
+                if later:
+                    # Keep a status that is already further along (IN () cannot be used with executemany)
+                    further = or_(*(table.c.status == later_status for later_status in later))
+                    values["status"] = case((further, table.c.status), else_=values["status"])
+                db.execute(update(table).where(table.c.id == bindparam("b_id")).values(**values), rows)
+            changes = record_changes(db, list(batch))
+            db.commit()
+        return changes
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "updates": self._updates,
+                "rows_written": self._rows,
+                "flushes": self._flushes,
+                "avg_batch": round(self._rows / self._flushes, 2) if self._flushes else 0.0,
+                "avg_flush_ms": round(self._flush_seconds / self._flushes * 1000, 3) if self._flushes else 0.0,
+            }
+
+status_writer = StatusWriter(
+    flush_interval=settings.status_flush_interval_ms / 1000,
+    batch_size=settings.status_batch_size
+)
+
+async def write_status(doc_id: str, status: str, **fields) -> Dict[str, Any]:
+    """Queue an update from a stage coroutine and wait for it to be committed."""
+    return await asyncio.wrap_future(status_writer.update(doc_id, status, **fields))
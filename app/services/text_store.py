@@ -0,0 +1,47 @@
+import hashlib
+import os
+import tempfile
+from typing import Optional
+from app.utils.config import settings
+from app.utils.logging import setup_logging
+
+logger = setup_logging()
+
+def _path(text_ref: str) -> str:
+    # Two levels of fan-out keep directories small
+    return os.path.join(settings.text_store_path, text_ref[:2], text_ref[2:4], f"{text_ref}.txt")
+
+def put_text(text: str) -> str:
+    """
+    Store extracted text once and return its reference (the SHA-256 of the text).
+    Identical texts share one file.
+    """
+    data = text.encode("utf-8")
+    text_ref = hashlib.sha256(data).hexdigest()
+    path = _path(text_ref)
+    if os.path.exists(path):
+        return text_ref
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    logger.info(f"Stored {len(data)} bytes of extracted text as {text_ref}")
+    return text_ref
+
+def get_text(text_ref: str) -> str:
+    with open(_path(text_ref), "rb") as f:
+        return f.read().decode("utf-8")
+
+def has_text(text_ref: str) -> bool:
+    return bool(text_ref) and os.path.exists(_path(text_ref))
+
+def inline_text(text_ref: str) -> Optional[str]:
+    """The text itself if it is small enough to travel inside an event, else None."""
+    if os.path.getsize(_path(text_ref)) > settings.text_store_inline_bytes:
+        return None
+    return get_text(text_ref)
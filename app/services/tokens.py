@@ -0,0 +1,88 @@
+import re
+from typing import List
+from app.utils.logging import setup_logging
+
+logger = setup_logging()
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o
+except ImportError:
+    _encoding = None
+    logger.warning("tiktoken is not installed, estimating token counts from text length")
+
+# Without tiktoken: English prose averages about four characters per token, but tables,
+# numbers and non-English text need fewer, so estimate high to stay inside the context
+CHARS_PER_TOKEN = 3
+
+# Lines that look like headings: numbered sections, ALL CAPS, or short lines ending in ':'
+_HEADING = re.compile(r"^\s*(?:\d+(?:\.\d+)*[.)]?\s+\S.{0,80}|[A-Z][A-Z0-9 &/,.'-]{3,80}|.{3,60}:)\s*$")
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+def split_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """
+    Split `text` into chunks of at most `max_tokens`, breaking between paragraphs (or
+    lines) where possible so entities are not cut in half.
+    """
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    chunks = []
+    current: List[str] = []
+    current_tokens = 0
+    for block in re.split(r"(\n\s*\n|\n)", text):
+        if not block:
+            continue
+        tokens = count_tokens(block)
+        if tokens > max_tokens:
+            # A single block larger than a chunk (e.g. text without line breaks)
+            while block:
+                piece = _truncate(block, max_tokens)
+                block = block[len(piece):]
+                if current:
+                    chunks.append("".join(current))
+                    current, current_tokens = [], 0
+                chunks.append(piece)
+            continue
+        if current_tokens + tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+def representative_excerpt(text: str, max_tokens: int) -> str:
+    """
+    At most `max_tokens` of `text` for classification: the opening of the document
+    (title, parties, first pages) followed by the headings found in the rest of it.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    opening = _truncate(text, max_tokens * 3 // 4)
+    headings = []
+    # Leave room for the separator line below
+    budget = max_tokens - count_tokens(opening) - 12
+    for line in text[len(opening):].splitlines():
+        if not _HEADING.match(line):
+            continue
+        line = line.strip()
+        tokens = count_tokens(line) + 1
+        if tokens > budget:
+            break
+        headings.append(line)
+        budget -= tokens
+    if not headings:
+        return opening
+    return opening + "\n...\nSection headings later in the document:\n" + "\n".join(headings)
@@ -13,14 +13,93 @@ class Settings(BaseSettings):
     app_title: str = "Document Ingestion System"
     app_version: str = "1.0.0"
     database_url: str = "sqlite:///documents.db"
+    db_pool_size: int = 16
+    db_max_overflow: int = 16
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    sqlite_busy_timeout_ms: int = 30000
+    api_db_workers: int = 8
+    status_flush_interval_ms: int = 5
+    status_batch_size: int = 200
     rabbitmq_host: str = "localhost"
     rabbitmq_port: int = 5672
     rabbitmq_user: str = "guest"
     rabbitmq_password: str = "guest"
+    message_bus_backend: str = "rabbitmq"
+    memory_queue_size: int = 10000
+    publisher_pool_size: int = 8
+    publisher_pool_timeout: float = 5.0
+    publisher_confirms: bool = False
     azure_openai_key: str = ""
     azure_openai_api_version: str = ""
     azure_openai_endpoint: str = ""
     azure_openai_deployment: str = ""
+    llm_combined_mode: bool = False
+    llm_classification_max_tokens: int = 3000
+    llm_chunk_tokens: int = 6000
+    llm_chunk_concurrency: int = 4
+    llm_requests_per_minute: int = 300
+    llm_tokens_per_minute: int = 100000
+    llm_rate_limit_path: str = ""
+    llm_initial_concurrency: int = 8
+    llm_min_concurrency: int = 1
+    llm_max_concurrency: int = 32
+    llm_latency_spike_factor: float = 3.0
+    llm_max_retries: int = 4
+    local_classifier_enabled: bool = True
+    local_classifier_threshold: float = 0.85
+    local_classifier_model_path: str = "models/local_classifier.npz"
+    local_classifier_min_samples: int = 50
+    local_classifier_confirm_confidence: float = 90
+    local_classifier_retrain_seconds: int = 3600
+    local_classifier_rule_confidence: float = 0.7
+    local_classifier_max_samples_per_type: int = 500
+    result_cache_enabled: bool = True
+    result_cache_path: str = "cache/results.db"
+    result_cache_max_entries: int = 10000
+    result_cache_max_bytes: int = 512 * 1024 * 1024
+    result_cache_ttl_seconds: int = 30 * 24 * 3600
+    text_store_path: str = "text_store"
+    text_store_inline_bytes: int = 16 * 1024
+    prompt_cache_enabled: bool = True
+    prompt_cache_max_entries: int = 20000
+    prompt_cache_ttl_seconds: int = 7 * 24 * 3600
+    vision_document_concurrency: int = 4
+    vision_global_concurrency: int = 8
+    vision_min_image_size: int = 64
+    vision_dedup_max_distance: int = 4
+    vision_dedup_max_edge: int = 512
+    vision_cache_enabled: bool = True
+    vision_cache_max_entries: int = 2000
+    vision_max_long_edge: int = 2048
+    vision_grayscale: bool = False
+    vision_image_format: str = "JPEG"
+    vision_image_quality: int = 85
+    vision_max_image_bytes: int = 1024 * 1024
+    run_workers_in_api: bool = True
+    pipeline_executor_workers: int = 32
+    llm_executor_workers: int = 32
+    ingestor_consumers: int = 1
+    ingestor_prefetch: int = 10
+    extractor_consumers: int = 4
+    extractor_prefetch: int = 1
+    classifier_consumers: int = 8
+    classifier_prefetch: int = 1
+    classifier_batch_size: int = 8
+    classifier_batch_window_ms: int = 200
+    classifier_batch_max_tokens: int = 6000
+    classifier_batch_doc_tokens: int = 1500
+    router_consumers: int = 1
+    router_prefetch: int = 10
+    max_upload_size: int = 256 * 1024 * 1024
+    upload_chunk_size: int = 1024 * 1024
+    websocket_queue_size: int = 256
+    websocket_send_timeout: float = 10.0
+    change_log_retention: int = 100000
+    change_feed_replay_limit: int = 1000
+    change_feed_poll_interval: float = 1.0
+    change_feed_max_wait: float = 30.0
 
     class Config:
         env_file = ".env"
@@ -34,14 +113,90 @@ class Settings(BaseSettings):
                 self.app_title = yaml_config.get("app", {}).get("title", self.app_title)
                 self.app_version = yaml_config.get("app", {}).get("version", self.app_version)
                 self.database_url = yaml_config.get("database", {}).get("url", self.database_url)
+                self.db_pool_size = yaml_config.get("database", {}).get("pool_size", self.db_pool_size)
+                self.db_max_overflow = yaml_config.get("database", {}).get("max_overflow", self.db_max_overflow)
+                self.db_pool_timeout = yaml_config.get("database", {}).get("pool_timeout", self.db_pool_timeout)
+                self.db_pool_recycle = yaml_config.get("database", {}).get("pool_recycle", self.db_pool_recycle)
+                self.db_pool_pre_ping = yaml_config.get("database", {}).get("pool_pre_ping", self.db_pool_pre_ping)
+                self.sqlite_busy_timeout_ms = yaml_config.get("database", {}).get("sqlite_busy_timeout_ms", self.sqlite_busy_timeout_ms)
+                self.api_db_workers = yaml_config.get("database", {}).get("api_workers", self.api_db_workers)
+                self.status_flush_interval_ms = yaml_config.get("database", {}).get("status_flush_interval_ms", self.status_flush_interval_ms)
+                self.status_batch_size = yaml_config.get("database", {}).get("status_batch_size", self.status_batch_size)
                 self.rabbitmq_host = yaml_config.get("message_bus", {}).get("rabbitmq_host", self.rabbitmq_host)
                 self.rabbitmq_port = yaml_config.get("message_bus", {}).get("rabbitmq_port", self.rabbitmq_port)
                 self.rabbitmq_user = yaml_config.get("message_bus", {}).get("rabbitmq_user", self.rabbitmq_user)
                 self.rabbitmq_password = yaml_config.get("message_bus", {}).get("rabbitmq_password", self.rabbitmq_password)
+                self.message_bus_backend = yaml_config.get("message_bus", {}).get("backend", self.message_bus_backend)
+                self.memory_queue_size = yaml_config.get("message_bus", {}).get("memory_queue_size", self.memory_queue_size)
+                self.publisher_pool_size = yaml_config.get("message_bus", {}).get("publisher_pool_size", self.publisher_pool_size)
+                self.publisher_pool_timeout = yaml_config.get("message_bus", {}).get("publisher_pool_timeout", self.publisher_pool_timeout)
+                self.publisher_confirms = yaml_config.get("message_bus", {}).get("publisher_confirms", self.publisher_confirms)
                 self.azure_openai_key = yaml_config.get("azure_openai_key", {}).get("key", self.azure_openai_key)
                 self.azure_openai_api_version = yaml_config.get("azure_openai_api_version", {}).get("api_version", self.azure_openai_api_version)
                 self.azure_openai_endpoint = yaml_config.get("azure_openai_endpoint", {}).get("endpoint", self.azure_openai_endpoint)
                 self.azure_openai_deployment = yaml_config.get("azure_openai_deployment", {}).get("deployment", self.azure_openai_deployment)
+                self.llm_combined_mode = yaml_config.get("llm", {}).get("combined_mode", self.llm_combined_mode)
+                self.llm_classification_max_tokens = yaml_config.get("llm", {}).get("classification_max_tokens", self.llm_classification_max_tokens)
+                self.llm_chunk_tokens = yaml_config.get("llm", {}).get("chunk_tokens", self.llm_chunk_tokens)
+                self.llm_chunk_concurrency = yaml_config.get("llm", {}).get("chunk_concurrency", self.llm_chunk_concurrency)
+                self.llm_requests_per_minute = yaml_config.get("llm", {}).get("requests_per_minute", self.llm_requests_per_minute)
+                self.llm_tokens_per_minute = yaml_config.get("llm", {}).get("tokens_per_minute", self.llm_tokens_per_minute)
+                self.llm_rate_limit_path = yaml_config.get("llm", {}).get("rate_limit_path", self.llm_rate_limit_path)
+                self.llm_initial_concurrency = yaml_config.get("llm", {}).get("initial_concurrency", self.llm_initial_concurrency)
+                self.llm_min_concurrency = yaml_config.get("llm", {}).get("min_concurrency", self.llm_min_concurrency)
+                self.llm_max_concurrency = yaml_config.get("llm", {}).get("max_concurrency", self.llm_max_concurrency)
+                self.llm_latency_spike_factor = yaml_config.get("llm", {}).get("latency_spike_factor", self.llm_latency_spike_factor)
+                self.llm_max_retries = yaml_config.get("llm", {}).get("max_retries", self.llm_max_retries)
+                self.local_classifier_enabled = yaml_config.get("local_classifier", {}).get("enabled", self.local_classifier_enabled)
+                self.local_classifier_threshold = yaml_config.get("local_classifier", {}).get("threshold", self.local_classifier_threshold)
+                self.local_classifier_model_path = yaml_config.get("local_classifier", {}).get("model_path", self.local_classifier_model_path)
+                self.local_classifier_min_samples = yaml_config.get("local_classifier", {}).get("min_samples", self.local_classifier_min_samples)
+                self.local_classifier_confirm_confidence = yaml_config.get("local_classifier", {}).get("confirm_confidence", self.local_classifier_confirm_confidence)
+                self.local_classifier_retrain_seconds = yaml_config.get("local_classifier", {}).get("retrain_seconds", self.local_classifier_retrain_seconds)
+                self.local_classifier_rule_confidence = yaml_config.get("local_classifier", {}).get("rule_confidence", self.local_classifier_rule_confidence)
+                self.local_classifier_max_samples_per_type = yaml_config.get("local_classifier", {}).get("max_samples_per_type", self.local_classifier_max_samples_per_type)
+                self.result_cache_enabled = yaml_config.get("result_cache", {}).get("enabled", self.result_cache_enabled)
+                self.result_cache_path = yaml_config.get("result_cache", {}).get("path", self.result_cache_path)
+                self.result_cache_max_entries = yaml_config.get("result_cache", {}).get("max_entries", self.result_cache_max_entries)
+                self.result_cache_max_bytes = yaml_config.get("result_cache", {}).get("max_bytes", self.result_cache_max_bytes)
+                self.result_cache_ttl_seconds = yaml_config.get("result_cache", {}).get("ttl_seconds", self.result_cache_ttl_seconds)
+                self.prompt_cache_enabled = yaml_config.get("result_cache", {}).get("prompts_enabled", self.prompt_cache_enabled)
+                self.prompt_cache_max_entries = yaml_config.get("result_cache", {}).get("prompts_max_entries", self.prompt_cache_max_entries)
+                self.prompt_cache_ttl_seconds = yaml_config.get("result_cache", {}).get("prompts_ttl_seconds", self.prompt_cache_ttl_seconds)
+                self.text_store_path = yaml_config.get("text_store", {}).get("path", self.text_store_path)
+                self.text_store_inline_bytes = yaml_config.get("text_store", {}).get("inline_bytes", self.text_store_inline_bytes)
+                self.vision_document_concurrency = yaml_config.get("vision", {}).get("document_concurrency", self.vision_document_concurrency)
+                self.vision_global_concurrency = yaml_config.get("vision", {}).get("global_concurrency", self.vision_global_concurrency)
+                self.vision_min_image_size = yaml_config.get("vision", {}).get("min_image_size", self.vision_min_image_size)
+                self.vision_dedup_max_distance = yaml_config.get("vision", {}).get("dedup_max_distance", self.vision_dedup_max_distance)
+                self.vision_dedup_max_edge = yaml_config.get("vision", {}).get("dedup_max_edge", self.vision_dedup_max_edge)
+                self.vision_cache_enabled = yaml_config.get("vision", {}).get("cache_enabled", self.vision_cache_enabled)
+                self.vision_cache_max_entries = yaml_config.get("vision", {}).get("cache_max_entries", self.vision_cache_max_entries)
+                self.vision_max_long_edge = yaml_config.get("vision", {}).get("max_long_edge", self.vision_max_long_edge)
+                self.vision_grayscale = yaml_config.get("vision", {}).get("grayscale", self.vision_grayscale)
+                self.vision_image_format = yaml_config.get("vision", {}).get("image_format", self.vision_image_format)
+                self.vision_image_quality = yaml_config.get("vision", {}).get("image_quality", self.vision_image_quality)
+                self.vision_max_image_bytes = yaml_config.get("vision", {}).get("max_image_bytes", self.vision_max_image_bytes)
+                self.run_workers_in_api = yaml_config.get("workers", {}).get("run_in_api", self.run_workers_in_api)
+                self.pipeline_executor_workers = yaml_config.get("workers", {}).get("executor_threads", self.pipeline_executor_workers)
+                self.llm_executor_workers = yaml_config.get("workers", {}).get("llm_threads", self.llm_executor_workers)
+                for stage in ("ingestor", "extractor", "classifier", "router"):
+                    stage_config = yaml_config.get("workers", {}).get(stage, {})
+                    setattr(self, f"{stage}_consumers", stage_config.get("consumers", getattr(self, f"{stage}_consumers")))
+                    setattr(self, f"{stage}_prefetch", stage_config.get("prefetch", getattr(self, f"{stage}_prefetch")))
+                batch_config = yaml_config.get("workers", {}).get("classifier", {}).get("batch", {})
+                self.classifier_batch_size = batch_config.get("max_docs", self.classifier_batch_size)
+                self.classifier_batch_window_ms = batch_config.get("window_ms", self.classifier_batch_window_ms)
+                self.classifier_batch_max_tokens = batch_config.get("max_tokens", self.classifier_batch_max_tokens)
+                self.classifier_batch_doc_tokens = batch_config.get("doc_tokens", self.classifier_batch_doc_tokens)
+                self.max_upload_size = yaml_config.get("uploads", {}).get("max_size", self.max_upload_size)
+                self.upload_chunk_size = yaml_config.get("uploads", {}).get("chunk_size", self.upload_chunk_size)
+                self.websocket_queue_size = yaml_config.get("websocket", {}).get("queue_size", self.websocket_queue_size)
+                self.websocket_send_timeout = yaml_config.get("websocket", {}).get("send_timeout", self.websocket_send_timeout)
+                self.change_log_retention = yaml_config.get("change_feed", {}).get("retention", self.change_log_retention)
+                self.change_feed_replay_limit = yaml_config.get("change_feed", {}).get("replay_limit", self.change_feed_replay_limit)
+                self.change_feed_poll_interval = yaml_config.get("change_feed", {}).get("poll_interval", self.change_feed_poll_interval)
+                self.change_feed_max_wait = yaml_config.get("change_feed", {}).get("max_wait", self.change_feed_max_wait)
 
 # Initialize settings
 settings = Settings()
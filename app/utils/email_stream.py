@@ -0,0 +1,163 @@
+import base64
+import binascii
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from uuid import uuid4
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+from app.utils.helpers import AtomicFileWriter, remove_file, upload_path
+from app.utils.logging import setup_logging
+
+logger = setup_logging()
+
+# Plain form fields (from, subject, text, ...) are kept in memory up to this size
+MAX_FIELD_SIZE = 1024 * 1024
+
+@dataclass
+class StreamedAttachment:
+    doc_id: str
+    filename: str
+    content_type: str
+    file_path: str
+    file_size: int
+    content_hash: str
+
+def discard_attachments(attachments: List[StreamedAttachment]):
+    """Delete saved attachment files, e.g. ones that could not be ingested."""
+    for attachment in attachments:
+        remove_file(attachment.file_path)
+
+class Base64StreamDecoder:
+    """
+    Incremental base64 decoder for MIME bodies: ignores line breaks and carries
+    incomplete 4-byte groups over to the next write.
+    """
+
+    def __init__(self, underlying):
+        self.underlying = underlying
+        self._pending = b""
+
+    def write(self, data: bytes):
+        data = self._pending + data.translate(None, b" \t\r\n")
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        if usable:
+            self.underlying.write(base64.b64decode(data[:usable]))
+
+    def finalize(self):
+        if self._pending:
+            raise binascii.Error("Truncated base64 attachment")
+
+class MultipartEmailParser:
+    """
+    Streaming parser for multipart/form-data email webhooks (e.g. SendGrid Inbound Parse).
+    Every part with a filename is given a doc_id and written straight to `upload_dir`
+    under it as its bytes arrive (base64-decoded on the fly when the part declares it),
+    so memory use does not depend on attachment size or count. Other parts are
+    collected in `fields`.
+    """
+
+    def __init__(self, content_type: str, upload_dir: str = "uploads"):
+        mime_type, params = parse_options_header(content_type)
+        if mime_type != b"multipart/form-data" or b"boundary" not in params:
+            raise ValueError("Expected a multipart/form-data body with a boundary")
+        self.upload_dir = upload_dir
+        os.makedirs(upload_dir, exist_ok=True)
+        self.fields: Dict[str, str] = {}
+        self.attachments: List[StreamedAttachment] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[str, bytes] = {}
+        self._name: Optional[str] = None
+        self._filename: Optional[str] = None
+        self._doc_id: Optional[str] = None
+        self._field_value = bytearray()
+        self._writer: Optional[AtomicFileWriter] = None
+        self._sink = None
+        self._parser = MultipartParser(params[b"boundary"], callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def write(self, chunk: bytes):
+        """Feed the next chunk of the request body. Blocking; run it off the event loop."""
+        self._parser.write(chunk)
+
+    def finalize(self):
+        self._parser.finalize()
+
+    def abort(self):
+        """Discard the attachment being written and every attachment already saved."""
+        if self._writer:
+            self._writer.abort()
+            self._writer = None
+        discard_attachments(self.attachments)
+        self.attachments = []
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._name = None
+        self._filename = None
+        self._field_value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.decode("latin-1").lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, disposition = parse_options_header(self._headers.get("content-disposition", b""))
+        self._name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = disposition.get(b"filename")
+        if filename is None:
+            return
+        # Only keep the base name so a crafted filename cannot escape upload_dir
+        basename = os.path.basename(filename.decode("utf-8", "replace").replace("\\", "/"))
+        if basename in ("", ".", ".."):
+            # e.g. an empty file input (filename=""); there is no file name to store it under
+            logger.warning(f"Treating part {self._name!r} with filename {filename!r} as a form field")
+            return
+        self._filename = basename
+        self._doc_id = str(uuid4())
+        self._writer = AtomicFileWriter(upload_path(self._doc_id, basename, self.upload_dir))
+        encoding = self._headers.get("content-transfer-encoding", b"").strip().lower()
+        self._sink = Base64StreamDecoder(self._writer) if encoding == b"base64" else self._writer
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._writer:
+            self._sink.write(data[start:end])
+            return
+        if len(self._field_value) + end - start > MAX_FIELD_SIZE:
+            raise ValueError(f"Form field {self._name} exceeds {MAX_FIELD_SIZE} bytes")
+        self._field_value += data[start:end]
+
+    def _on_part_end(self):
+        if not self._writer:
+            self.fields[self._name] = self._field_value.decode("utf-8", "replace")
+            return
+        if isinstance(self._sink, Base64StreamDecoder):
+            self._sink.finalize()
+        file_size, content_hash = self._writer.commit()
+        self.attachments.append(StreamedAttachment(
+            doc_id=self._doc_id,
+            filename=self._filename,
+            content_type=self._headers.get("content-type", b"application/octet-stream").decode("latin-1"),
+            file_path=self._writer.file_path,
+            file_size=file_size,
+            content_hash=content_hash
+        ))
+        logger.info(f"Streamed email attachment to {self._writer.file_path}")
+        self._writer = None
+        self._sink = None
@@ -1,45 +1,111 @@
 import base64
+import hashlib
 import os
-from typing import Tuple
+import tempfile
+from typing import BinaryIO, Iterable, Tuple
 from fastapi import UploadFile
 from app.api.v1.schemas import Attachment
+from app.utils.config import settings
 from app.utils.logging import setup_logging
 from datetime import datetime
 from decimal import Decimal
 
 logger = setup_logging()
 
-def save_uploaded_file(file: UploadFile) -> str:
+class FileTooLargeError(Exception):
+    """Raised when a streamed file exceeds `settings.max_upload_size`."""
+
+def read_chunks(source: BinaryIO, chunk_size: int = None) -> Iterable[bytes]:
+    chunk_size = chunk_size or settings.upload_chunk_size
+    return iter(lambda: source.read(chunk_size), b"")
+
+class AtomicFileWriter:
+    """
+    Writes into a temp file next to `file_path`, hashing as it goes; `commit()` renames
+    it into place so readers never see a partial file, `abort()` discards it.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.size = 0
+        self._digest = hashlib.sha256()
+        fd, self._temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".", prefix=".upload-", suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > settings.max_upload_size:
+            raise FileTooLargeError(f"{os.path.basename(self.file_path)} exceeds {settings.max_upload_size} bytes")
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self) -> Tuple[int, str]:
+        """Returns (size, sha256 hex digest)."""
+        self._file.close()
+        os.replace(self._temp_path, self.file_path)
+        return self.size, self._digest.hexdigest()
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.unlink(self._temp_path)
+
+def write_file_atomically(chunks: Iterable[bytes], file_path: str) -> Tuple[int, str]:
+    """
+    Stream `chunks` to `file_path` through an AtomicFileWriter.
+    Returns (size, sha256 hex digest).
+    """
+    writer = AtomicFileWriter(file_path)
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+        return writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+
+def upload_path(doc_id: str, filename: str, upload_dir: str = "uploads") -> str:
+    """
+    Where a document's file is stored. Prefixed with the doc_id so uploads that share a
+    filename never overwrite each other; only the base name of `filename` is used.
+    """
+    basename = os.path.basename(filename.replace("\\", "/"))
+    return os.path.join(upload_dir, f"{doc_id}_{basename}")
+
+def remove_file(file_path: str):
+    if file_path and os.path.exists(file_path):
+        os.unlink(file_path)
+
+def save_uploaded_file(file: UploadFile, doc_id: str) -> Tuple[str, int, str]:
+    """
+    Blocking; call it from a worker thread. Returns (file_path, size, sha256).
+    """
     upload_dir = "uploads"
     os.makedirs(upload_dir, exist_ok=True)
-    file_path = os.path.join(upload_dir, file.filename)
+    file_path = upload_path(doc_id, file.filename, upload_dir)
     
     try:
-        with open(file_path, "wb") as f:
-            content = file.file.read()
-            f.write(content)
+        file_size, content_hash = write_file_atomically(read_chunks(file.file), file_path)
         logger.info(f"Saved file to {file_path}")
-        return file_path
+        return file_path, file_size, content_hash
     except Exception as e:
         logger.error(f"Failed to save file {file.filename}: {e}")
         raise
 
-def save_email_attachment(attachment: Attachment) -> Tuple[str, str, int]:
+def save_email_attachment(attachment: Attachment, doc_id: str) -> Tuple[str, str, int, str]:
     upload_dir = "uploads"
     os.makedirs(upload_dir, exist_ok=True)
-    file_path = os.path.join(upload_dir, attachment.filename)
+    file_path = upload_path(doc_id, attachment.filename, upload_dir)
     
     try:
         # Decode base64 content
         content = base64.b64decode(attachment.content)
-        file_size = len(content)
         
         # Save to file
-        with open(file_path, "wb") as f:
-            f.write(content)
+        file_size, content_hash = write_file_atomically([content], file_path)
         
         logger.info(f"Saved email attachment to {file_path}")
-        return file_path, attachment.filename, file_size
+        return file_path, attachment.filename, file_size, content_hash
     except Exception as e:
         logger.error(f"Failed to save email attachment {attachment.filename}: {e}")
         raise
@@ -1,32 +1,172 @@
-from typing import Set, Dict, Optional
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
 from fastapi import WebSocket
-import json
 import asyncio
+import itertools
+import json
+import time
+
+from app.utils.config import settings
+from app.utils.logging import setup_logging
+
+logger = setup_logging()
+
+# Close code for clients dropped for falling behind (RFC 6455 "try again later")
+CLOSE_TRY_AGAIN_LATER = 1013
+
+class ClientChannel:
+    """
+    Outbound side of one WebSocket: a bounded queue of encoded messages, keyed so a
+    newer message for the same key replaces one that has not been sent yet, and a task
+    that sends them in order.
+    """
+
+    def __init__(self, websocket: WebSocket, max_pending: int, filters: Optional[Dict] = None):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        # Only messages whose fields equal all of these are queued
+        self.filters = filters or {}
+        self.pending: "OrderedDict[Hashable, str]" = OrderedDict()
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        # When the send in progress started, None while idle
+        self.sending_since: Optional[float] = None
+
+    def offer(self, key: Hashable, payload: str) -> bool:
+        """Queue `payload`; False when the client already has `max_pending` messages waiting."""
+        if key in self.pending:
+            self.pending[key] = payload
+            return True
+        if len(self.pending) >= self.max_pending:
+            return False
+        self.pending[key] = payload
+        self.ready.set()
+        return True
+
+class Broadcaster:
+    """
+    Fans messages out to connected WebSockets. Each message is encoded once; each client
+    has its own bounded queue and sender task, so a slow client delays only itself and is
+    disconnected once its queue is full or, at the next message, when a send has taken
+    longer than `send_timeout`.
+    """
 
-# Store connected WebSocket clients
-document_clients: Set[WebSocket] = set()
-mailbox_clients: Set[WebSocket] = set()
+    def __init__(self, name: str, max_pending: int, send_timeout: float):
+        self.name = name
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.channels: Dict[WebSocket, ClientChannel] = {}
+        self._sequence = itertools.count()
+        self._messages = 0
+        self._sent = 0
+        self._coalesced = 0
+        self._evicted = 0
+
+    def connect(self, websocket: WebSocket, filters: Optional[Dict] = None, paused: bool = False) -> ClientChannel:
+        """
+        Register an accepted WebSocket; must be called from the loop that owns it. A paused
+        client queues messages but sends nothing until `replay` is called.
+        """
+        channel = ClientChannel(websocket, self.max_pending, filters)
+        self.channels[websocket] = channel
+        if not paused:
+            channel.task = asyncio.create_task(self._send_forever(channel))
+        return channel
+
+    def replay(self, websocket: WebSocket, messages: List[Tuple[Optional[Hashable], Dict]]):
+        """
+        Send `(key, message)` pairs ahead of what a paused client queued since it connected,
+        then start sending. A message whose key was queued since is skipped, being older.
+        """
+        channel = self.channels.get(websocket)
+        if channel is None or channel.task is not None:
+            return
+        for key, message in reversed(messages):
+            if key is None:
+                key = ("message", next(self._sequence))
+            if key not in channel.pending:
+                channel.pending[key] = json.dumps(message, default=str)
+                channel.pending.move_to_end(key, last=False)
+        if channel.pending:
+            channel.ready.set()
+        channel.task = asyncio.create_task(self._send_forever(channel))
+
+    def disconnect(self, websocket: WebSocket):
+        channel = self.channels.pop(websocket, None)
+        if channel is not None and channel.task is not None and channel.task is not asyncio.current_task():
+            channel.task.cancel()
+
+    def publish(self, message: Dict, key: Optional[Hashable] = None):
+        """
+        Queue `message` for every client. Messages with the same `key` (e.g. a doc_id)
+        replace each other while unsent; messages without a key are always delivered.
+        """
+        payload = json.dumps(message, default=str)
+        if key is None:
+            key = ("message", next(self._sequence))
+        self._messages += 1
+        now = time.monotonic()
+        for channel in list(self.channels.values()):
+            # Checked here rather than with a timeout around every send, which costs a task per send
+            if channel.sending_since is not None and now - channel.sending_since > self.send_timeout:
+                self._evict(channel, f"send took over {self.send_timeout}s")
+                continue
+            if channel.filters and any(message.get(name) != value for name, value in channel.filters.items()):
+                continue
+            queued = len(channel.pending)
+            if not channel.offer(key, payload):
+                self._evict(channel, f"{queued} messages behind")
+            elif len(channel.pending) == queued:
+                self._coalesced += 1
+
+    async def _send_forever(self, channel: ClientChannel):
+        while True:
+            await channel.ready.wait()
+            while channel.pending:
+                _, payload = channel.pending.popitem(last=False)
+                channel.sending_since = time.monotonic()
+                try:
+                    await channel.websocket.send_text(payload)
+                except Exception:
+                    # The connection is gone; the endpoint unregisters it when its receive fails
+                    self.disconnect(channel.websocket)
+                    return
+                channel.sending_since = None
+                self._sent += 1
+            channel.ready.clear()
+
+    def _evict(self, channel: ClientChannel, reason: str):
+        self._evicted += 1
+        logger.warning(f"Disconnecting slow {self.name} WebSocket client ({reason})")
+        self.disconnect(channel.websocket)
+        asyncio.create_task(self._close(channel.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=CLOSE_TRY_AGAIN_LATER), self.send_timeout)
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        pending = [len(channel.pending) for channel in self.channels.values()]
+        return {
+            "clients": len(self.channels),
+            "messages": self._messages,
+            "sent": self._sent,
+            "coalesced": self._coalesced,
+            "evicted": self._evicted,
+            "pending": sum(pending),
+            "max_pending": max(pending, default=0),
+        }
+
+document_broadcaster = Broadcaster("document", settings.websocket_queue_size, settings.websocket_send_timeout)
+mailbox_broadcaster = Broadcaster("mailbox", settings.websocket_queue_size, settings.websocket_send_timeout)
 
 async def broadcast_document_update(document: Dict):
     """
     Broadcast document status update to all connected document clients.
     """
-    # message = {
-    #     "doc_id": document["doc_id"],
-    #     "status": document["status"],
-    #     "type": document.get("type"),
-    #     "confidence": document.get("confidence"),
-    #     "destination": document.get("destination"),
-    #     "last_updated": document["last_updated"],
-    # }
-
-    disconnected_clients = set()
-    for client in document_clients:
-        try:
-            asyncio.create_task(client.send_json(document))
-        except:
-            disconnected_clients.add(client)
-    document_clients.difference_update(disconnected_clients)
+    document_broadcaster.publish(document, key=document.get("id") or document.get("doc_id"))
 
 async def broadcast_mailbox_update(config_id: str, status: str, message: str, doc_id: Optional[str] = None):
     """
@@ -38,10 +178,4 @@ async def broadcast_mailbox_update(config_id: str, status: str, message: str, do
         "message": message,
         "doc_id": doc_id,
     }
-    disconnected_clients = set()
-    for client in mailbox_clients:
-        try:
-            await client.send_json(message)
-        except:
-            disconnected_clients.add(client)
-    mailbox_clients.difference_update(disconnected_clients)
\ No newline at end of file
+    mailbox_broadcaster.publish(message)
@@ -0,0 +1,50 @@
+"""
+Compare storing N document rows the way POST /ingest/upload does (add, commit, refresh
+per file) with the single-transaction bulk insert used by POST /ingest/bulk.
+Publishing is not included because it needs a running broker.
+
+    python -m benchmarks.bench_bulk_ingest [N]
+"""
+import os
+import sys
+import tempfile
+import time
+from uuid import uuid4
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.models.document import Base, Document
+
+def per_file(session_factory, count: int):
+    db = session_factory()
+    for i in range(count):
+        document = Document(id=str(uuid4()), name=f"scan-{i}.pdf", status="ingested", content_hash=uuid4().hex)
+        db.add(document)
+        db.commit()
+        db.refresh(document)
+    db.close()
+
+def bulk(session_factory, count: int):
+    db = session_factory()
+    rows = [
+        {"id": str(uuid4()), "name": f"scan-{i}.pdf", "status": "ingested", "content_hash": uuid4().hex}
+        for i in range(count)
+    ]
+    db.execute(insert(Document), rows)
+    db.commit()
+    db.close()
+
+def measure(name: str, strategy, count: int):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        started = time.perf_counter()
+        strategy(session_factory, count)
+        elapsed = time.perf_counter() - started
+        engine.dispose()
+    print(f"{name:<9} {count} rows in {elapsed * 1000:>8.1f} ms ({count / elapsed:>9.0f} rows/s)")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    measure("per-file", per_file, count)
+    measure("bulk", bulk, count)
@@ -0,0 +1,85 @@
+"""
+Cost of a dashboard reconnecting after missing K status changes, on a temporary SQLite
+database of N documents: reloading the full list the way GET /documents pages through
+it vs. reading only the missed changes as GET /documents/changes does. Reports time
+and response bytes per reconnect and for a storm of 100 clients reconnecting at once.
+
+    python -m benchmarks.bench_change_feed [N] [K]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from app.utils.config import settings
+
+directory = tempfile.mkdtemp()
+settings.database_url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+
+from sqlalchemy import insert, update
+from app.api.v1.routes.documents import decode_cursor, list_documents
+from app.database.db import session_scope
+from app.models.document import Document
+from app.services.change_log import read_changes, record_changes
+
+CLIENTS = 100
+PAGE = 1000
+
+def create_documents(count: int):
+    ids = [f"doc-{i:07d}" for i in range(count)]
+    with session_scope() as db:
+        for start in range(0, count, 5000):
+            chunk = ids[start:start + 5000]
+            db.execute(insert(Document), [{"id": doc_id, "name": f"{doc_id}.pdf", "status": "routed"} for doc_id in chunk])
+            record_changes(db, chunk)
+            db.commit()
+    return ids
+
+def change_documents(ids, count: int):
+    with session_scope() as db:
+        changed = ids[:count]
+        db.execute(update(Document).where(Document.id.in_(changed)).values(status="classified", type="invoice", confidence=0.9))
+        record_changes(db, changed)
+        db.commit()
+
+def full_reload() -> int:
+    size = 0
+    position = None
+    with session_scope() as db:
+        while True:
+            page, cursor = list_documents(db, None, None, None, PAGE, position)
+            size += len(json.dumps([document.dict() for document in page], default=str))
+            if not cursor:
+                return size
+            position = decode_cursor(cursor)
+
+def changes_since(since: int) -> int:
+    with session_scope() as db:
+        changes, seq, reset, more = read_changes(db, since, None, None, PAGE)
+        return len(json.dumps({"changes": changes, "seq": seq, "reset": reset, "more": more}))
+
+def measure(name: str, reconnect):
+    started = time.perf_counter()
+    size = reconnect()
+    single = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(CLIENTS):
+        reconnect()
+    storm = time.perf_counter() - started
+    print(
+        f"{name:<12} {single * 1000:8.1f} ms  {size / 1024:9.1f} KiB per reconnect  "
+        f"{CLIENTS} clients: {storm:6.2f}s, {size * CLIENTS / 2 ** 20:8.1f} MiB"
+    )
+
+def main(count: int, missed: int):
+    ids = create_documents(count)
+    since = count
+    change_documents(ids, missed)
+    print(f"{count} documents, {missed} changed while the client was away")
+    measure("full reload", full_reload)
+    measure("change feed", lambda: changes_since(since))
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    missed = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    main(count, missed)
@@ -0,0 +1,84 @@
+"""
+Classification throughput and per-document latency for batch sizes 1..N. The LLM is
+simulated: each call takes a fixed overhead plus a per-input-token cost, and at most
+LLM_CONCURRENCY calls run at once (as under a deployment's rate limit), so batching
+pays off by amortizing the per-call overhead.
+
+    python -m benchmarks.bench_classifier_batching [N]
+"""
+import asyncio
+import json
+import re
+import statistics
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from app.utils.config import settings
+
+settings.result_cache_enabled = False
+
+from app.agents import classifier
+from app.message_bus.events import DocTextEvent
+from app.services import llm
+
+CALL_OVERHEAD = 0.4
+SECONDS_PER_TOKEN = 0.00002
+DOCUMENTS = 64
+CONCURRENCY = 16
+LLM_CONCURRENCY = 4
+
+_llm_slots = threading.BoundedSemaphore(LLM_CONCURRENCY)
+calls = 0
+
+def simulated_completion(messages, **kwargs):
+    global calls
+    content = messages[-1]["content"]
+    with _llm_slots:
+        calls += 1
+        time.sleep(CALL_OVERHEAD + SECONDS_PER_TOKEN * len(content) / 4)
+    doc_ids = re.findall(r"^### Document (\S+)$", content, re.MULTILINE)
+    if doc_ids:
+        reply = {"results": [{"doc_id": doc_id, "category": "receipt", "confidence_score": 90} for doc_id in doc_ids]}
+    else:
+        reply = {"category": "receipt", "confidence_score": 90}
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(reply)))])
+
+async def run(batch_size: int):
+    global calls
+    calls = 0
+    classifier.batcher = classifier.ClassificationBatcher(
+        max_docs=batch_size,
+        window_seconds=settings.classifier_batch_window_ms / 1000,
+        max_tokens=settings.classifier_batch_max_tokens
+    )
+    slots = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def one(i: int):
+        async with slots:
+            event = DocTextEvent(doc_id=f"doc-{i}", text="Receipt 42, total 19.99 EUR. " * 40, entities={})
+            started = time.perf_counter()
+            await classifier.classify_event(event)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(DOCUMENTS)))
+    elapsed = time.perf_counter() - started
+    millis = sorted(latency * 1000 for latency in latencies)
+    print(
+        f"batch {batch_size:>2}  {calls:>3} calls  {DOCUMENTS / elapsed:6.1f} docs/s  "
+        f"latency p50 {statistics.median(millis):6.0f} ms  p95 {millis[int(len(millis) * 0.95) - 1]:6.0f} ms"
+    )
+
+def main(max_batch: int):
+    llm.llm.chat.completions.create = simulated_completion
+    print(
+        f"{DOCUMENTS} documents, {CONCURRENCY} in flight, "
+        f"{LLM_CONCURRENCY} concurrent calls of {CALL_OVERHEAD * 1000:.0f} ms + input tokens"
+    )
+    for batch_size in range(1, max_batch + 1):
+        asyncio.run(run(batch_size))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8)
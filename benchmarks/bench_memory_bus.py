@@ -0,0 +1,45 @@
+"""
+Hop cost of the in-memory message bus: from a publish on a worker thread until the
+stage coroutine runs on the pipeline loop. Latency is measured one message at a time,
+throughput with a burst of N messages.
+
+    python -m benchmarks.bench_memory_bus [N]
+"""
+import statistics
+import sys
+import threading
+import time
+from app.utils.config import settings
+
+settings.message_bus_backend = "memory"
+
+from app.agents.runtime import StageConsumer
+from app.message_bus.memory import memory_broker
+
+def main(count: int):
+    latencies = []
+    received = threading.Semaphore(0)
+
+    async def handler(body: str):
+        latencies.append(time.perf_counter() - float(body))
+        received.release()
+
+    StageConsumer("bench", "bench.hop", handler, concurrency=64, prefetch=256).start()
+    time.sleep(0.2)
+
+    for _ in range(1000):
+        memory_broker.publish("bench.hop", repr(time.perf_counter()))
+        received.acquire()
+    micros = sorted(latency * 1_000_000 for latency in latencies)
+    print(f"latency    p50 {statistics.median(micros):.1f} us  p99 {micros[int(len(micros) * 0.99) - 1]:.1f} us")
+
+    started = time.perf_counter()
+    for _ in range(count):
+        memory_broker.publish("bench.hop", repr(time.perf_counter()))
+    for _ in range(count):
+        received.acquire()
+    elapsed = time.perf_counter() - started
+    print(f"throughput {count} messages in {elapsed * 1000:.1f} ms ({count / elapsed:.0f} msg/s)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
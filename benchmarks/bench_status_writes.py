@@ -0,0 +1,72 @@
+"""
+Document status writes as the pipeline stages make them: N documents each move through
+extracted -> classified -> routed from 32 concurrent threads. Compares the former
+per-update SELECT/UPDATE/COMMIT/refresh with the batched status writer, on a
+temporary SQLite database.
+
+    python -m benchmarks.bench_status_writes [N]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+from app.utils.config import settings
+
+directory = tempfile.mkdtemp()
+settings.database_url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+
+from sqlalchemy import insert
+from app.database.db import session_scope
+from app.models.document import Document
+from app.services.status_writer import StatusWriter
+from app.utils.helpers import sqlalchemy_obj_to_dict
+
+THREADS = 32
+STEPS = [
+    ("extracted", {"text_ref": "0" * 64}),
+    ("classified", {"type": "invoice", "confidence": 90}),
+    ("routed", {"destination": "finance"}),
+]
+
+def create_documents(count: int):
+    ids = [str(uuid4()) for _ in range(count)]
+    with session_scope() as db:
+        db.execute(insert(Document), [{"id": doc_id, "name": "bench.pdf", "status": "ingested"} for doc_id in ids])
+        db.commit()
+    return ids
+
+def per_update(doc_id: str, status: str, fields: dict):
+    with session_scope() as db:
+        document = db.query(Document).filter(Document.id == doc_id).first()
+        document.status = status
+        for name, value in fields.items():
+            setattr(document, name, value)
+        db.commit()
+        db.refresh(document)
+        return sqlalchemy_obj_to_dict(document)
+
+def measure(count: int, write):
+    ids = create_documents(count)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        for status, fields in STEPS:
+            list(executor.map(lambda doc_id: write(doc_id, status, fields), ids))
+    return time.perf_counter() - started
+
+def main(count: int):
+    elapsed = measure(count, per_update)
+    updates = count * len(STEPS)
+    print(f"per-update commits  {updates} updates in {elapsed:.2f}s  ({updates / elapsed:.0f} updates/s, {updates / elapsed:.0f} commits/s)")
+
+    writer = StatusWriter(flush_interval=settings.status_flush_interval_ms / 1000, batch_size=settings.status_batch_size)
+    elapsed = measure(count, lambda doc_id, status, fields: writer.update(doc_id, status, **fields).result())
+    stats = writer.stats()
+    print(
+        f"status writer       {updates} updates in {elapsed:.2f}s  ({updates / elapsed:.0f} updates/s, "
+        f"{stats['flushes'] / elapsed:.0f} commits/s, {stats['avg_batch']} rows per commit)"
+    )
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,45 @@
+"""
+Compare the vision payload produced by the old full-resolution PNG encoding with the
+prepared (downscaled, recompressed) encoding used by process_file.
+
+    python -m benchmarks.bench_vision_payload
+"""
+import base64
+import random
+import time
+from io import BytesIO
+from PIL import Image, ImageDraw
+from app.services.llm import encode_image_to_base64, prepare_image_for_vision
+
+def synthetic_scan(width: int = 2480, height: int = 3508) -> Image.Image:
+    """An A4 page at 300 dpi with text-like strokes and scanner noise."""
+    rng = random.Random(42)
+    image = Image.new("RGB", (width, height), (250, 248, 240))
+    draw = ImageDraw.Draw(image)
+    for y in range(200, height - 200, 60):
+        x = 200
+        while x < width - 300:
+            word = rng.randint(40, 220)
+            draw.rectangle((x, y, x + word, y + 28), fill=(rng.randint(0, 60),) * 3)
+            x += word + rng.randint(20, 40)
+    noise = Image.effect_noise((width, height), 12).convert("RGB")
+    return Image.blend(image, noise, 0.08)
+
+def legacy_encode(image: Image.Image) -> str:
+    buffered = BytesIO()
+    image.save(buffered, format="PNG")
+    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    return f"data:image/png;base64,{img_str}"
+
+def measure(name: str, encode, image: Image.Image, rounds: int = 3):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        payload = encode(image)
+        timings.append(time.perf_counter() - started)
+    print(f"{name:<10} payload={len(payload) / 1024:>9.1f} KiB  encode={min(timings) * 1000:>8.1f} ms")
+
+if __name__ == "__main__":
+    page = synthetic_scan()
+    measure("legacy", legacy_encode, page)
+    measure("prepared", lambda image: encode_image_to_base64(prepare_image_for_vision(image)), page)
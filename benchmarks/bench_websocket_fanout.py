@@ -0,0 +1,120 @@
+"""
+WebSocket fan-out to N simulated dashboard clients: most take 1 ms per send, 5% take
+200 ms and 1% never finish a send. U status updates for 100 documents are broadcast at
+200 per second. Compares the former task-per-client-per-update broadcast with the
+broadcaster's per-client queues: time spent broadcasting, peak memory, outstanding
+sends once the updates stop, and how long fast clients take to get the final state.
+
+    python -m benchmarks.bench_websocket_fanout [N] [U]
+"""
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from app.utils.websocket import Broadcaster
+
+DOCUMENTS = 100
+RATE = 200
+
+class SimulatedClient:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.received = 0
+        self.closed = False
+
+    async def send_text(self, text: str):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+
+    async def send_json(self, data: dict):
+        await self.send_text(json.dumps(data))
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+def simulated_clients(count: int):
+    clients = []
+    for i in range(count):
+        if i % 100 == 0:
+            clients.append(SimulatedClient(3600.0))
+        elif i % 20 == 0:
+            clients.append(SimulatedClient(0.2))
+        else:
+            clients.append(SimulatedClient(0.001))
+    return clients
+
+def updates(count: int):
+    statuses = ["ingested", "extracted", "classified", "routed"]
+    for i in range(count):
+        yield {
+            "id": f"doc-{i % DOCUMENTS}",
+            "status": statuses[(i // DOCUMENTS) % len(statuses)],
+            "type": "invoice",
+            "confidence": 0.93,
+            "destination": "finance",
+            "updated_at": f"2025-01-01T00:00:{i % 60:02d}.{i:06d}",
+        }
+
+async def per_client_tasks(clients, update_count: int):
+    """The former broadcast: one send task per client per update."""
+    tasks = set()
+    broadcast_seconds = 0.0
+    for document in updates(update_count):
+        started = time.perf_counter()
+        for client in clients:
+            task = asyncio.create_task(client.send_json(document))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        broadcast_seconds += time.perf_counter() - started
+        await asyncio.sleep(1 / RATE)
+    fast = [client for client in clients if client.delay <= 0.001]
+    drain_started = time.perf_counter()
+    while any(client.received < update_count for client in fast):
+        await asyncio.sleep(0.01)
+    return broadcast_seconds, len(tasks), time.perf_counter() - drain_started, None
+
+async def broadcaster(clients, update_count: int):
+    fanout = Broadcaster("bench", max_pending=256, send_timeout=1.0)
+    for client in clients:
+        fanout.connect(client)
+    broadcast_seconds = 0.0
+    for document in updates(update_count):
+        started = time.perf_counter()
+        fanout.publish(document, key=document["id"])
+        broadcast_seconds += time.perf_counter() - started
+        await asyncio.sleep(1 / RATE)
+    outstanding = fanout.stats()["pending"]
+    fast = [fanout.channels[client] for client in clients if client.delay <= 0.001]
+    drain_started = time.perf_counter()
+    while any(channel.pending or channel.sending_since is not None for channel in fast):
+        await asyncio.sleep(0.01)
+    drain_seconds = time.perf_counter() - drain_started
+    stats = fanout.stats()
+    for websocket in list(fanout.channels):
+        fanout.disconnect(websocket)
+    return broadcast_seconds, outstanding, drain_seconds, stats
+
+async def measure(name: str, strategy, client_count: int, update_count: int):
+    clients = simulated_clients(client_count)
+    tracemalloc.start()
+    broadcast_seconds, outstanding, drain_seconds, stats = await strategy(clients, update_count)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    fast = [client.received for client in clients if client.delay <= 0.001]
+    print(
+        f"{name:<16} broadcast {broadcast_seconds / update_count * 1000:7.3f} ms/update  peak {peak / 2 ** 20:7.1f} MiB  "
+        f"outstanding {outstanding:>7}  fast clients current after {drain_seconds * 1000:6.0f} ms "
+        f"({sum(fast) / len(fast):.0f} messages each)"
+    )
+    if stats:
+        print(f"{'':<16} coalesced {stats['coalesced']}, evicted {stats['evicted']} of {client_count} clients")
+
+async def main(client_count: int, update_count: int):
+    await measure("per-client tasks", per_client_tasks, client_count, update_count)
+    await measure("broadcaster", broadcaster, client_count, update_count)
+
+if __name__ == "__main__":
+    client_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    update_count = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    asyncio.run(main(client_count, update_count))
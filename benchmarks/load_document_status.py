@@ -0,0 +1,124 @@
+"""
+Load test: latency of GET /documents/{doc_id} while uploads arrive at a fixed rate, with the
+API's database work done on the event loop (as the routes used to do it) and on the
+dedicated API database executor (run_db). Each mode starts the API under uvicorn in a
+subprocess, with the in-memory message bus, no pipeline workers and a temporary SQLite
+database, and drives it over HTTP from this process. Every statement is delayed by
+DB_LATENCY_MS to stand in for the round trip to a database server.
+
+    python -m benchmarks.load_document_status [UPLOADS_PER_SECOND] [SECONDS] [DB_LATENCY_MS]
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+READS_PER_SECOND = 50
+FILE = b"%PDF-1.4 benchmark\n" + os.urandom(4 * 1024)
+
+def serve(mode: str, port: int, latency_ms: float):
+    from app.utils.config import settings
+    settings.database_url = f"sqlite:///{os.path.join(os.getcwd(), 'bench.db')}"
+    settings.message_bus_backend = "memory"
+    settings.run_workers_in_api = False
+
+    import uvicorn
+    from sqlalchemy import event
+    from app.api.v1.routes import documents, ingestion
+    from app.database.db import engine, session_scope
+    from app.main import app
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def round_trip(*args):
+        time.sleep(latency_ms / 1000)
+
+    if mode == "inline":
+        async def run_inline(func, *args, **kwargs):
+            # The former behaviour: a blocking session used directly in the async route
+            with session_scope() as db:
+                return func(db, *args, **kwargs)
+        documents.run_db = ingestion.run_db = run_inline
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+async def measure(client: httpx.AsyncClient, doc_id: str, upload_rate: int, seconds: float):
+    latencies = []
+    uploads = []
+    deadline = time.perf_counter() + seconds
+
+    async def read(number: int):
+        started = time.perf_counter()
+        response = await client.get(f"/documents/{doc_id}")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+    async def upload(number: int):
+        response = await client.post("/ingest/upload", files={"file": (f"load-{number}.pdf", FILE, "application/pdf")})
+        response.raise_for_status()
+
+    async def arrive(rate: int, request, tasks: list):
+        # Open loop, so both modes get the same load however fast they serve it
+        number = 0
+        while rate and time.perf_counter() < deadline:
+            tasks.append(asyncio.create_task(request(number)))
+            number += 1
+            await asyncio.sleep(1 / rate)
+
+    reads = []
+    await asyncio.gather(arrive(READS_PER_SECOND, read, reads), arrive(upload_rate, upload, uploads))
+    await asyncio.gather(*reads, *uploads)
+    return latencies, len(uploads)
+
+async def wait_until_up(client: httpx.AsyncClient):
+    for _ in range(200):
+        try:
+            await client.get("/health")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("API did not start")
+
+async def scenario(mode: str, upload_rate: int, seconds: float, latency_ms: float):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    directory = tempfile.mkdtemp()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.load_document_status", "--serve", mode, str(port), str(latency_ms)],
+        cwd=directory, env={**os.environ, "PYTHONPATH": os.getcwd()}
+    )
+    limits = httpx.Limits(max_connections=None)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            await wait_until_up(client)
+            response = await client.post("/ingest/upload", files={"file": ("target.pdf", FILE, "application/pdf")})
+            doc_id = response.json()["doc_id"]
+            for load in (0, upload_rate):
+                latencies, uploads = await measure(client, doc_id, load, seconds)
+                print(
+                    f"{mode:<7} {load:>3} uploads/s  GET p50 {percentile(latencies, 0.5):7.2f} ms  "
+                    f"p99 {percentile(latencies, 0.99):7.2f} ms  ({len(latencies)} reads, {uploads} uploads)"
+                )
+    finally:
+        server.terminate()
+        server.wait()
+
+async def main(upload_rate: int, seconds: float, latency_ms: float):
+    await scenario("inline", upload_rate, seconds, latency_ms)
+    await scenario("run_db", upload_rate, seconds, latency_ms)
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        serve(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]))
+    else:
+        upload_rate = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+        seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 8.0
+        latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+        asyncio.run(main(upload_rate, seconds, latency_ms))
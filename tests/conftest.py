@@ -0,0 +1,6 @@
+import os
+
+# The Azure OpenAI client is created at import time; tests never reach the endpoint
+os.environ.setdefault("AZURE_OPENAI_KEY", "test")
+os.environ.setdefault("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.invalid")
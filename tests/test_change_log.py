@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.document import Base, Document
+from app.services.change_log import read_changes, record_changes
+
+@pytest.fixture
+def sessions(tmp_path):
+    # SQLite serializes writers by itself; set TEST_DATABASE_URL to a scratch PostgreSQL
+    # database to exercise the change log's own serialization
+    engine = create_engine(os.environ.get("TEST_DATABASE_URL") or f"sqlite:///{tmp_path / 'changes.db'}")
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+def test_change_carries_the_notification_payload(sessions):
+    with sessions() as db:
+        db.add(Document(id="a", name="invoice.pdf", status="extracted", text_ref="ab12", type_source="llm",
+                        content_hash="ff", created_at=datetime(2024, 1, 1), updated_at=datetime(2024, 1, 2)))
+        db.flush()
+        change = record_changes(db, ["a"])["a"]
+        db.commit()
+    assert set(change) == {"seq", "id", "name", "status", "type", "confidence", "destination", "created_at", "updated_at"}
+    assert change["name"] == "invoice.pdf"
+    assert change["created_at"] == "2024-01-01T00:00:00"
+
+def test_interleaved_writers_never_commit_out_of_seq_order(sessions):
+    with sessions() as db:
+        db.add_all([Document(id=doc_id, name=f"{doc_id}.pdf", status="ingested") for doc_id in ("a", "b")])
+        db.commit()
+
+    first = sessions()
+    first.query(Document).filter_by(id="a").update({"status": "extracted"})
+    first_seq = record_changes(first, ["a"])["a"]["seq"]
+
+    # The second writer starts after the first recorded its change and tries to commit first
+    def second_writer():
+        with sessions() as db:
+            db.query(Document).filter_by(id="b").update({"status": "extracted"})
+            change = record_changes(db, ["b"])["b"]
+            db.commit()
+            return change["seq"]
+
+    with ThreadPoolExecutor(1) as executor:
+        second = executor.submit(second_writer)
+        time.sleep(0.3)
+        assert not second.done()
+
+        # A client polling meanwhile sees nothing newer and keeps its cursor
+        with sessions() as reader:
+            changes, seq, reset, _ = read_changes(reader, 0, None, None, 100)
+        assert (changes, reset) == ([], False)
+
+        first.commit()
+        first.close()
+        second_seq = second.result(timeout=10)
+
+    assert first_seq < second_seq
+    with sessions() as reader:
+        changes, _, _, _ = read_changes(reader, seq, None, None, 100)
+    assert [change["id"] for change in changes] == ["a", "b"]
@@ -0,0 +1,42 @@
+import os
+from app.utils.email_stream import MultipartEmailParser
+
+BOUNDARY = "boundary42"
+
+def body(*parts) -> bytes:
+    chunks = []
+    for disposition, content in parts:
+        chunks.append(f"--{BOUNDARY}\r\nContent-Disposition: form-data; {disposition}\r\n\r\n{content}\r\n")
+    return ("".join(chunks) + f"--{BOUNDARY}--\r\n").encode()
+
+def parse(data: bytes, upload_dir: str) -> MultipartEmailParser:
+    parser = MultipartEmailParser(f"multipart/form-data; boundary={BOUNDARY}", upload_dir)
+    parser.write(data)
+    parser.finalize()
+    return parser
+
+def test_nameless_file_parts_are_fields(tmp_path):
+    data = body(
+        ('name="subject"', "Invoice"),
+        ('name="empty"; filename=""', ""),
+        ('name="folder"; filename="C:\\scans\\"', "x"),
+        ('name="attachment1"; filename="invoice.pdf"', "%PDF-1.4"),
+    )
+    parser = parse(data, str(tmp_path))
+    assert [attachment.filename for attachment in parser.attachments] == ["invoice.pdf"]
+    assert parser.fields["subject"] == "Invoice"
+    assert parser.fields["empty"] == ""
+    assert os.listdir(tmp_path) == [os.path.basename(parser.attachments[0].file_path)]
+
+def test_attachments_with_the_same_name_are_kept_apart(tmp_path):
+    parser = parse(body(('name="attachment1"; filename="scan.pdf"', "first"), ('name="attachment2"; filename="scan.pdf"', "second")), str(tmp_path))
+    first, second = parser.attachments
+    assert first.doc_id != second.doc_id
+    assert first.file_path == os.path.join(str(tmp_path), f"{first.doc_id}_scan.pdf")
+    assert [open(attachment.file_path).read() for attachment in parser.attachments] == ["first", "second"]
+
+def test_abort_removes_saved_attachments(tmp_path):
+    parser = parse(body(('name="attachment1"; filename="a.pdf"', "a"), ('name="attachment2"; filename="b.pdf"', "b")), str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 2
+    parser.abort()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,21 @@
+from app.services import classifier
+from app.utils.config import settings
+
+REMINDER = "Payment reminder\nOur invoice number 4711 of 1 March is still unpaid."
+
+def test_rule_alone_is_below_the_threshold(monkeypatch):
+    monkeypatch.setattr(classifier.local_classifier, "predict", lambda text: (None, 0.0))
+    doc_type, confidence, source = classifier.classify_document(REMINDER)
+    assert (doc_type, source) == ("invoice", "rules")
+    assert confidence < settings.local_classifier_threshold
+
+def test_rule_confirmed_by_the_model(monkeypatch):
+    monkeypatch.setattr(classifier.local_classifier, "predict", lambda text: ("invoice", 0.7))
+    doc_type, confidence, source = classifier.classify_document(REMINDER)
+    assert (doc_type, source) == ("invoice", "rules")
+    assert confidence >= settings.local_classifier_threshold
+
+def test_rule_contradicted_by_the_model(monkeypatch):
+    monkeypatch.setattr(classifier.local_classifier, "predict", lambda text: ("reminder", 0.95))
+    _, confidence, _ = classifier.classify_document(REMINDER)
+    assert confidence < settings.local_classifier_threshold
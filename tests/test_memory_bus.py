@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.agents import runtime
+from app.message_bus import memory
+from app.message_bus.memory import InMemoryBroker, topic_matches
+from app.utils.config import settings
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_topic_matching():
+    assert topic_matches("doc.received", "doc.received")
+    assert topic_matches("doc.*", "doc.text")
+    assert not topic_matches("doc.*", "doc.text.large")
+    assert topic_matches("doc.#", "doc")
+    assert topic_matches("doc.#", "doc.text.large")
+    assert topic_matches("#.routed", "doc.routed")
+    assert not topic_matches("doc.*", "mail.text")
+
+def test_publish_routes_to_matching_queues():
+    broker = InMemoryBroker(10)
+    texts = broker.declare_queue("texts", "doc.text")
+    everything = broker.declare_queue("everything", "#")
+    broker.publish("doc.text", "a")
+    broker.publish("doc.routed", "b")
+    assert texts.qsize() == 1
+    assert everything.qsize() == 2
+
+def test_full_queue(monkeypatch):
+    monkeypatch.setattr(settings, "publisher_pool_timeout", 0.05)
+    broker = InMemoryBroker(1)
+    target = broker.declare_queue("tiny", "doc.test")
+    broker.publish("doc.test", "first")
+    # The API side gives up after publisher_pool_timeout
+    with pytest.raises(TimeoutError):
+        broker.publish("doc.test", "second")
+
+    # A stage waits for room instead of losing the message
+    async def stage_publish():
+        publishing = asyncio.ensure_future(broker.publish_async("doc.test", "second"))
+        await asyncio.sleep(0.1)
+        assert not publishing.done()
+        assert target.get_nowait() == "first"
+        await asyncio.wait_for(publishing, 5)
+    asyncio.run(stage_publish())
+    assert target.get_nowait() == "second"
+
+def test_consumer_takes_at_most_prefetch_messages(monkeypatch):
+    broker = InMemoryBroker(100)
+    monkeypatch.setattr(memory, "memory_broker", broker)
+    release = threading.Event()
+    started, finished = [], []
+
+    async def handler(body: bytes):
+        started.append(body)
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        finished.append(body)
+
+    consumer = runtime.StageConsumer("prefetch-test", "doc.prefetch", handler, concurrency=1, prefetch=3)
+    source = broker.declare_queue(runtime.stage_queue("prefetch-test"), "doc.prefetch")
+    for number in range(10):
+        broker.publish("doc.prefetch", f"message-{number}")
+    threading.Thread(target=consumer._consume_memory, daemon=True).start()
+
+    wait_until(lambda: source.qsize() == 7)
+    time.sleep(0.1)
+    assert source.qsize() == 7
+    assert len(started) == 1
+    release.set()
+    wait_until(lambda: len(finished) == 10)
@@ -0,0 +1,17 @@
+from app.services.llm import merge_entities
+
+def test_other_entities_list_is_merged_under_items():
+    merged = merge_entities([
+        {"Dates": ["2024-01-05"], "Other Entities": {"Invoice Number": "INV-1"}},
+        {"Dates": ["2024-01-05"], "Other Entities": ["PO-7", "Net 30"]},
+        {"Other Entities": ["po-7", "VAT 20%"]},
+    ])
+    assert merged["Dates"] == ["2024-01-05"]
+    assert merged["Other Entities"] == {"Invoice Number": "INV-1", "items": ["PO-7", "Net 30", "VAT 20%"]}
+
+def test_other_entities_list_first():
+    merged = merge_entities([{"Other Entities": ["PO-7"]}, {"Other Entities": {"Reference": "A1"}}])
+    assert merged["Other Entities"] == {"items": ["PO-7"], "Reference": "A1"}
+
+def test_non_object_results_are_skipped():
+    assert merge_entities([["not", "entities"], {"Parties": ["Acme"]}])["Parties"] == ["Acme"]
@@ -0,0 +1,21 @@
+import asyncio
+from app.services.status_writer import StatusWriter
+
+def test_cancelled_waiter_does_not_stop_the_writer(monkeypatch):
+    writer = StatusWriter(flush_interval=0.05, batch_size=100)
+    monkeypatch.setattr(writer, "_flush", lambda batch: {
+        doc_id: {"id": doc_id, "status": values["status"], "seq": 1} for doc_id, values in batch.items()
+    })
+
+    async def scenario():
+        cancelled = asyncio.ensure_future(asyncio.wrap_future(writer.update("a", "extracted")))
+        waiting = asyncio.wrap_future(writer.update("b", "extracted"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        first = await asyncio.wait_for(waiting, 5)
+        later = await asyncio.wait_for(asyncio.wrap_future(writer.update("c", "routed")), 5)
+        return first, later
+
+    first, later = asyncio.run(scenario())
+    assert (first["id"], first["seq"]) == ("b", 1)
+    assert later["status"] == "routed"
@@ -0,0 +1,61 @@
+from io import BytesIO
+from PIL import Image, ImageDraw
+from app.services import llm
+
+A4 = (1240, 1754)  # 150 dpi
+
+def scanned_page(number: int) -> bytes:
+    """A white A4 page of black text, laid out a little differently per page."""
+    page = Image.new("L", A4, 255)
+    draw = ImageDraw.Draw(page)
+    for line in range(40):
+        draw.text((100 + (number * 37) % 200, 120 + line * 38), f"Page {number} line {line}: invoice item {number * line}", fill=0)
+    if number % 2:
+        for row in range(6):
+            draw.rectangle((120, 1300 + row * 50, 1100, 1350 + row * 50), outline=0)
+    buffered = BytesIO()
+    page.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+def logo() -> Image.Image:
+    image = Image.new("RGB", (200, 80), "white")
+    ImageDraw.Draw(image).ellipse((10, 10, 190, 70), fill="navy")
+    return image
+
+def encode(image: Image.Image, image_format: str, **params) -> bytes:
+    buffered = BytesIO()
+    image.save(buffered, format=image_format, **params)
+    return buffered.getvalue()
+
+class MemoryCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, cost_seconds=0.0):
+        self.entries[key] = value
+
+def test_distinct_full_page_scans_are_all_summarized(monkeypatch):
+    summarized = []
+    monkeypatch.setattr(llm, "vision_cache", MemoryCache())
+    monkeypatch.setattr(llm, "summarize_image_with_vision", lambda image: summarized.append(image) or f"summary {len(summarized)}")
+
+    deduplicator = llm.ImageDeduplicator()
+    pages = [deduplicator.load(scanned_page(number)) for number in range(10)]
+
+    assert all(page is not None for page in pages)
+    summaries = llm.summarize_images(pages)
+    assert len(summaries) == 10
+    assert len(summarized) == 10
+
+def test_identical_page_bytes_are_dropped():
+    deduplicator = llm.ImageDeduplicator()
+    assert deduplicator.load(scanned_page(1)) is not None
+    assert deduplicator.load(scanned_page(1)) is None
+
+def test_reencoded_logo_is_dropped():
+    deduplicator = llm.ImageDeduplicator()
+    assert deduplicator.load(encode(logo(), "PNG")) is not None
+    assert deduplicator.load(encode(logo(), "JPEG", quality=70)) is None
@@ -0,0 +1,25 @@
+from PIL import Image, ImageDraw
+from app.services import llm
+
+def signature(mode: str) -> Image.Image:
+    """Dark strokes on a fully transparent background."""
+    if mode == "P":
+        # Palette index 0 (black) is the transparent colour
+        image = Image.new("P", (300, 120), 0)
+        image.putpalette([0, 0, 0, 20, 20, 80])
+        image.info["transparency"] = 0
+        ImageDraw.Draw(image).line((20, 90, 280, 30), fill=1, width=6)
+        return image
+    image = Image.new("RGBA", (300, 120), (0, 0, 0, 0))
+    ImageDraw.Draw(image).line((20, 90, 280, 30), fill=(20, 20, 80, 255), width=6)
+    return image.convert(mode)
+
+def test_transparent_background_becomes_white():
+    for mode in ("RGBA", "LA", "P"):
+        prepared = llm.prepare_image_for_vision(signature(mode))
+        assert prepared.mode == "RGB"
+        assert prepared.getpixel((5, 5)) == (255, 255, 255), mode
+
+def test_strokes_stay_dark():
+    prepared = llm.prepare_image_for_vision(signature("RGBA"))
+    assert max(prepared.getpixel((150, 60))) < 128